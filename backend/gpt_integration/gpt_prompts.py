@@ -1,35 +1,161 @@
-from openai_client import chat_completion
+import asyncio
+import time
+from typing import AsyncIterator, Optional, Union
 
-# Templates for LLM-driven reports
-_PROMPTS = {
-    "event_report": """
+import orjson
+
+from openai_client import DEFAULT_MAX_TOKENS, chat_completion, chat_completion_stream, submit_reports_batch, await_batch
+
+# Static analyst instructions go in the system message so every request shares a
+# byte-identical prefix that the API's prompt cache can reuse
+SYSTEM_EVENT = """
 You are an expert maritime security analyst. Given the following incident data, 
 generate a structured event report including:
 - Incident summary
 - Vessel identity
 - Timestamp and location
 - Recommended next actions
+"""
 
-Incident Data:
-{incident_data}
-""",
-    "vessel_report": """
+SYSTEM_VESSEL = """
 You are a maritime data specialist. Generate a vessel report with:
 - Vessel name and flag
 - Vessel type
 - Recent movements summary
 - Any AIS anomalies detected
 - Risk assessment
+"""
 
+# Templates for the variable part of each report request
+_PROMPTS = {
+    "event_report": """
+Incident Data:
+{incident_data}
+""",
+    "vessel_report": """
 Vessel Data:
 {vessel_data}
 """
 }
 
-def generate_event_report(incident_data: str) -> str:
-    prompt = _PROMPTS["event_report"].format(incident_data=incident_data)
-    return chat_completion(prompt)
+# Pre-split templates so building a prompt is plain concatenation, not a format parse
+_EVENT_PREFIX, _EVENT_SUFFIX = _PROMPTS["event_report"].split("{incident_data}")
+_VESSEL_PREFIX, _VESSEL_SUFFIX = _PROMPTS["vessel_report"].split("{vessel_data}")
+
+# Reports are generated deterministically, so a repeated incident or vessel gets the same
+# report and chat_completion serves it from its response cache
+REPORT_TEMPERATURE = 0
+
+# Defaults for bulk generation; tune to the account's rate limits
+MAX_CONCURRENT_REQUESTS = 10
+MAX_REQUESTS_PER_MINUTE = 500
+MAX_TOKENS_PER_MINUTE = 200_000
+
+def _payload(data: Union[dict, str]) -> str:
+    # Sorted keys make equal payloads serialize identically, which helps every cache layer
+    if isinstance(data, dict):
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS).decode()
+    return data
+
+def _event_prompt(incident_data: Union[dict, str]) -> str:
+    return _EVENT_PREFIX + _payload(incident_data) + _EVENT_SUFFIX
+
+def _vessel_prompt(vessel_data: Union[dict, str]) -> str:
+    return _VESSEL_PREFIX + _payload(vessel_data) + _VESSEL_SUFFIX
+
+async def generate_event_report(incident_data: Union[dict, str]) -> str:
+    prompt = _event_prompt(incident_data)
+    return await chat_completion(prompt, temperature=REPORT_TEMPERATURE, system_message=SYSTEM_EVENT)
+
+async def generate_vessel_report(vessel_data: Union[dict, str]) -> str:
+    prompt = _vessel_prompt(vessel_data)
+    return await chat_completion(prompt, temperature=REPORT_TEMPERATURE, system_message=SYSTEM_VESSEL)
+
+async def generate_event_report_stream(incident_data: Union[dict, str]) -> AsyncIterator[str]:
+    async for delta in chat_completion_stream(_event_prompt(incident_data), temperature=REPORT_TEMPERATURE,
+                                             system_message=SYSTEM_EVENT):
+        yield delta
+
+async def generate_vessel_report_stream(vessel_data: Union[dict, str]) -> AsyncIterator[str]:
+    async for delta in chat_completion_stream(_vessel_prompt(vessel_data), temperature=REPORT_TEMPERATURE,
+                                             system_message=SYSTEM_VESSEL):
+        yield delta
+
+async def generate_event_reports_bulk(incidents: list[Union[dict, str]], mode: str = "online", **limits) -> list[Optional[str]]:
+    """
+    Generate event reports for many incidents, preserving input order.
+    mode="online" runs concurrent requests (accepting _complete_bulk's rate-limit
+    keyword arguments) and raises if a request fails; mode="batch" goes through the
+    slower, cheaper Batch API, where a failed request's report is None.
+    """
+    prompts = [_event_prompt(i) for i in incidents]
+    if mode == "batch":
+        return await _complete_batch(prompts, SYSTEM_EVENT)
+    return await _complete_bulk(prompts, SYSTEM_EVENT, **limits)
+
+async def generate_vessel_reports_bulk(vessels: list[Union[dict, str]], mode: str = "online", **limits) -> list[Optional[str]]:
+    """
+    Generate vessel reports for many vessels, preserving input order.
+    See generate_event_reports_bulk for the meaning of `mode`; in batch mode a
+    failed request's report is None.
+    """
+    prompts = [_vessel_prompt(v) for v in vessels]
+    if mode == "batch":
+        return await _complete_batch(prompts, SYSTEM_VESSEL)
+    return await _complete_bulk(prompts, SYSTEM_VESSEL, **limits)
+
+
+class _Throttle:
+    """
+    Token bucket that refills continuously at `per_minute` units per minute.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self.lock:
+            amount = min(amount, self.capacity)
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+
+async def _complete_bulk(prompts: list[str],
+                         system_message: str,
+                         max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+                         max_requests_per_minute: float = MAX_REQUESTS_PER_MINUTE,
+                         max_tokens_per_minute: float = MAX_TOKENS_PER_MINUTE) -> list[str]:
+    """
+    Run chat completions for all prompts concurrently under a concurrency cap and
+    request/token rate limits. Retries happen inside chat_completion.
+    """
+    sem = asyncio.Semaphore(max_concurrent_requests)
+    request_throttle = _Throttle(max_requests_per_minute)
+    token_throttle = _Throttle(max_tokens_per_minute)
+
+    async def _bounded(prompt: str) -> str:
+        async with sem:
+            await request_throttle.acquire()
+            # Rough estimate (~4 characters per token) plus the reply cap is enough for pacing
+            await token_throttle.acquire((len(system_message) + len(prompt)) // 4 + DEFAULT_MAX_TOKENS)
+            return await chat_completion(prompt, temperature=REPORT_TEMPERATURE, system_message=system_message)
+
+    return await asyncio.gather(*[_bounded(p) for p in prompts])
 
-def generate_vessel_report(vessel_data: str) -> str:
-    prompt = _PROMPTS["vessel_report"].format(vessel_data=vessel_data)
-    return chat_completion(prompt)
\ No newline at end of file
+async def _complete_batch(prompts: list[str], system_message: str) -> list[Optional[str]]:
+    """
+    Run all prompts as one Batch API job and wait for it; failed requests map to None.
+    """
+    batch_id = await submit_reports_batch(prompts, temperature=REPORT_TEMPERATURE, system_message=system_message)
+    replies = {custom_id: reply async for custom_id, reply in await_batch(batch_id)}
+    return [replies.get(str(i)) for i in range(len(prompts))]
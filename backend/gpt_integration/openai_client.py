@@ -1,24 +1,314 @@
+import asyncio
+import functools
+import hashlib
+import io
+import json
+import logging
 import os
+import re
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+from cachetools import TTLCache
 from dotenv import load_dotenv
-import openai
+import httpx
+import numpy as np
+import pybreaker
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 
-# load .env and configure API key
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+if TYPE_CHECKING:
+    import openai
 
-def chat_completion(prompt: str,
-                    model: str = "gpt-4",
-                    temperature: float = 0.7,
-                    system_message: str = "You are a helpful assistant.") -> str:
+# used when OPENAI_MODEL is not set
+DEFAULT_MODEL = "gpt-4o-mini"
+# reply length cap; the report templates fit comfortably and it bounds tail latency
+DEFAULT_MAX_TOKENS = 800
+
+# connection pool sizing; keep MAX_CONNECTIONS in line with the account's RPM quota
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 32
+_limits = httpx.Limits(max_connections=MAX_CONNECTIONS,
+                       max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+
+# transient failures are retried with jittered exponential backoff; after
+# BREAKER_FAIL_MAX consecutive failures calls fail fast for BREAKER_RESET_TIMEOUT seconds
+MAX_ATTEMPTS = 6
+BREAKER_FAIL_MAX = 10
+BREAKER_RESET_TIMEOUT = 30  # seconds
+
+# exact-match reply cache, keyed on a hash of everything that shapes the reply
+RESPONSE_CACHE_SIZE = 10_000
+RESPONSE_CACHE_TTL = 24 * 60 * 60  # seconds
+_response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+# volatile values masked out of cache keys; they change per report but not the analysis.
+# URLs stop at quotes so a URL inside compact JSON doesn't swallow the rest of the payload
+_URL_RE = re.compile(r"https?://[^\s\"'<>]+")
+_ISO_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})?")
+_UUID_RE = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+
+# semantic reply cache: reuse a reply when a new prompt embeds close to a cached one
+SEMANTIC_CACHE_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_THRESHOLD = 0.97
+SEMANTIC_CACHE_SIZE = 10_000
+
+# Batch API (50% cheaper, results within the completion window)
+BATCH_ENDPOINT = "/v1/chat/completions"
+_BATCH_TERMINAL_FAILURES = ("failed", "expired", "cancelled")
+
+@functools.lru_cache(maxsize=1)
+def _openai():
+    """
+    Import the openai SDK on first use so importing this module stays cheap.
+    """
+    import openai
+    return openai
+
+def _is_retryable(exc: BaseException) -> bool:
+    openai = _openai()
+    return isinstance(exc, (openai.RateLimitError, openai.APITimeoutError,
+                            openai.APIConnectionError, openai.InternalServerError))
+
+def _is_permanent(exc: BaseException) -> bool:
+    return not _is_retryable(exc)
+
+# only transient errors say anything about upstream health; rejected requests (bad
+# input, auth, unknown model) and cancelled callers must not open the breaker
+_breaker = pybreaker.CircuitBreaker(fail_max=BREAKER_FAIL_MAX,
+                                    reset_timeout=BREAKER_RESET_TIMEOUT,
+                                    exclude=[asyncio.CancelledError, _is_permanent])
+
+@functools.lru_cache(maxsize=1)
+def _load_env() -> None:
+    """
+    Load .env on first use rather than at import.
+    """
+    load_dotenv()
+
+@functools.lru_cache(maxsize=1)
+def _api_key() -> Optional[str]:
+    _load_env()
+    return os.getenv("OPENAI_API_KEY")
+
+@functools.lru_cache(maxsize=1)
+def _default_model() -> str:
+    _load_env()
+    return os.getenv("OPENAI_MODEL", DEFAULT_MODEL)
+
+@functools.lru_cache(maxsize=1)
+def get_sync_client() -> "openai.OpenAI":
+    """
+    Return the shared blocking OpenAI client, building it on first use.
+    """
+    return _openai().OpenAI(api_key=_api_key(), http_client=httpx.Client(limits=_limits))
+
+@functools.lru_cache(maxsize=1)
+def get_async_client() -> "openai.AsyncOpenAI":
+    """
+    Return the shared asyncio OpenAI client, building it on first use.
+    """
+    return _openai().AsyncOpenAI(api_key=_api_key(), http_client=httpx.AsyncClient(limits=_limits))
+
+class _SemanticCache:
+    """
+    Fixed-size ring buffer of unit-norm prompt embeddings and their replies.
+    A lookup hits when the best cosine similarity exceeds the threshold.
+    """
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, maxsize: int = SEMANTIC_CACHE_SIZE):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.embeddings: Optional[np.ndarray] = None  # allocated once the dimension is known
+        self.replies: list[Optional[str]] = [None] * maxsize
+        self.size = 0
+        self.next = 0
+
+    def lookup(self, embedding: np.ndarray) -> Optional[str]:
+        if self.size == 0:
+            return None
+        scores = self.embeddings[:self.size] @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] > self.threshold:
+            return self.replies[best]
+        return None
+
+    def add(self, embedding: np.ndarray, reply: str) -> None:
+        if self.embeddings is None:
+            self.embeddings = np.zeros((self.maxsize, embedding.shape[0]), dtype=np.float32)
+        self.embeddings[self.next] = embedding
+        self.replies[self.next] = reply
+        self.next = (self.next + 1) % self.maxsize
+        self.size = min(self.size + 1, self.maxsize)
+
+# one semantic cache per (model, temperature, max_tokens, system_message)
+_semantic_caches: dict[tuple[str, float, int, str], _SemanticCache] = {}
+
+async def _embed(text: str) -> np.ndarray:
+    response = await get_async_client().embeddings.create(model=SEMANTIC_CACHE_MODEL, input=text)
+    embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+def _normalize(prompt: str) -> str:
+    """
+    Replace URLs, ISO timestamps and UUIDs with placeholders for cache lookups.
+    """
+    return _UUID_RE.sub("<id>", _ISO_RE.sub("<ts>", _URL_RE.sub("<url>", prompt)))
+
+def _cache_key(prompt: str, model: str, temperature: float, system_message: str, max_tokens: int) -> str:
+    raw = f"{model}|{temperature}|{max_tokens}|{system_message}|{_normalize(prompt)}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+@retry(wait=wait_random_exponential(min=1, max=60),
+       stop=stop_after_attempt(MAX_ATTEMPTS),
+       retry=retry_if_exception(_is_retryable),
+       reraise=True)
+async def _create_completion(**kwargs):
+    """
+    Issue a chat completion request through the circuit breaker. An open breaker
+    raises pybreaker.CircuitBreakerError, which is not retried.
+    """
+    with _breaker.calling():
+        return await get_async_client().chat.completions.create(**kwargs)
+
+async def chat_completion(prompt: str,
+                          model: Optional[str] = None,
+                          temperature: float = 0.7,
+                          system_message: str = "You are a helpful assistant.",
+                          max_tokens: int = DEFAULT_MAX_TOKENS,
+                          cache: Optional[bool] = None,
+                          semantic_cache: bool = False) -> str:
     """
     Send a chat-style prompt to OpenAI and return the assistant's reply.
+    The model defaults to OPENAI_MODEL (falling back to DEFAULT_MODEL) and the
+    reply is capped at max_tokens.
+    Replies are cached by default only when temperature is 0, since sampled replies
+    should not be served as canonical; pass cache=True/False to override. Cache keys
+    ignore URLs, timestamps and UUIDs, but the original prompt is what gets sent.
+    With semantic_cache=True, an exact-cache miss also checks for a cached reply to
+    a near-identical prompt, at the cost of one embedding request.
     """
-    response = openai.ChatCompletion.create(
+    model = model or _default_model()
+    if cache is None:
+        cache = temperature == 0
+    if cache:
+        key = _cache_key(prompt, model, temperature, system_message, max_tokens)
+        cached = _response_cache.get(key)
+        if cached is not None:
+            return cached
+        if semantic_cache:
+            similar = _semantic_caches.setdefault((model, temperature, max_tokens, system_message), _SemanticCache())
+            embedding = await _embed(_normalize(prompt))
+            cached = similar.lookup(embedding)
+            if cached is not None:
+                _response_cache[key] = cached
+                return cached
+
+    response = await _create_completion(
         model=model,
         messages=[
             {"role": "system",  "content": system_message},
             {"role": "user",    "content": prompt}
         ],
         temperature=temperature,
+        max_tokens=max_tokens,
     )
-    return response.choices[0].message.content
\ No newline at end of file
+    content = response.choices[0].message.content
+    if cache:
+        _response_cache[key] = content
+        if semantic_cache:
+            similar.add(embedding, content)
+    return content
+
+async def chat_completion_stream(prompt: str,
+                                 model: Optional[str] = None,
+                                 temperature: float = 0.7,
+                                 system_message: str = "You are a helpful assistant.",
+                                 max_tokens: int = DEFAULT_MAX_TOKENS) -> AsyncIterator[str]:
+    """
+    Stream the assistant's reply to a chat-style prompt as text deltas.
+    Streamed replies bypass the response caches.
+    """
+    model = model or _default_model()
+    stream = await _create_completion(
+        model=model,
+        messages=[
+            {"role": "system",  "content": system_message},
+            {"role": "user",    "content": prompt}
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    async for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+async def submit_reports_batch(prompts: list[str],
+                               model: Optional[str] = None,
+                               temperature: float = 0.7,
+                               system_message: str = "You are a helpful assistant.",
+                               max_tokens: int = DEFAULT_MAX_TOKENS) -> str:
+    """
+    Upload prompts as an OpenAI Batch API job and return the batch id.
+    Each request's custom_id is the prompt's index in `prompts`.
+    """
+    model = model or _default_model()
+    lines = [
+        json.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": model,
+                "messages": [
+                    {"role": "system",  "content": system_message},
+                    {"role": "user",    "content": prompt}
+                ],
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+        })
+        for i, prompt in enumerate(prompts)
+    ]
+    client = get_async_client()
+    input_file = await client.files.create(
+        file=("reports.jsonl", io.BytesIO("\n".join(lines).encode())),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+    return batch.id
+
+async def await_batch(batch_id: str,
+                      poll_interval: float = 30.0,
+                      max_poll_interval: float = 600.0) -> AsyncIterator[tuple[str, Optional[str]]]:
+    """
+    Poll a Batch API job with exponential backoff until it completes, then yield
+    (custom_id, reply) pairs from its output and error files. The reply is None for
+    requests that failed; their errors are logged.
+    """
+    client = get_async_client()
+    delay = poll_interval
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status == "completed":
+            break
+        if batch.status in _BATCH_TERMINAL_FAILURES:
+            raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_poll_interval)
+
+    # failed requests are written to the error file, which is the only file when all of them fail
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        output = await client.files.content(file_id)
+        for line in output.text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                logging.warning(f"Batch {batch_id} request {record['custom_id']} failed: "
+                                f"{record.get('error') or response.get('body')}")
+                yield record["custom_id"], None
+                continue
+            yield record["custom_id"], response["body"]["choices"][0]["message"]["content"]
@@ -0,0 +1,91 @@
+import os
+import sys
+import types
+from unittest.mock import MagicMock
+from typing import Optional
+from pydantic import BaseModel
+
+# Stubs are installed when pytest imports this conftest, i.e. once per session and
+# before any test module is collected (test modules import their targets at module
+# level, so a fixture would run too late).
+
+# Let the temporal modules resolve their flat sibling imports (db_utils, activities, ...)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'temporals', 'base'))
+# ...and the GPT integration modules theirs (gpt_prompts imports openai_client)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'gpt_integration'))
+# ...and the AIS mock server, run as the flat module main (uvicorn main:app)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'ais_mock'))
+
+# Create a real in-memory shared module with minimal stubs
+shared_mod = types.ModuleType('shared')
+class ReportDetails(BaseModel):
+    source_account_id: str = "stub"
+    timestamp: str = "stub"
+    latitude: float = 0.0
+    longitude: float = 0.0
+    picture_url: str = "stub"
+    description: Optional[str] = None
+    vessel_registry: Optional[str] = None
+class EnrichedReportDetails(ReportDetails):
+    report_number: Optional[str] = None
+    trust_score: Optional[float] = None
+    ais_neighbours: Optional[list] = None
+    visibility: Optional[int] = 1
+    enriched_description: Optional[str] = None
+setattr(shared_mod, 'ReportDetails', ReportDetails)
+setattr(shared_mod, 'EnrichedReportDetails', EnrichedReportDetails)
+sys.modules['shared'] = shared_mod
+
+# Patch only the essential external dependencies
+def no_op_decorator(f):
+    return f
+
+temporalio_mod = types.ModuleType('temporalio')
+
+activity_mod = types.ModuleType('temporalio.activity')
+activity_mod.defn = no_op_decorator
+
+workflow_mod = types.ModuleType('temporalio.workflow')
+workflow_mod.defn = no_op_decorator
+workflow_mod.run = no_op_decorator
+workflow_mod.query = no_op_decorator
+
+# Add a dummy RetryPolicy to temporalio.common
+common_mod = types.ModuleType('temporalio.common')
+class RetryPolicy:
+    def __init__(self, *args, **kwargs):
+        pass
+common_mod.RetryPolicy = RetryPolicy
+
+# Add dummy Worker to temporalio.worker
+worker_mod = types.ModuleType('temporalio.worker')
+class Worker:
+    def __init__(self, *args, **kwargs):
+        pass
+worker_mod.Worker = Worker
+
+# Add dummy Client to temporalio.client
+client_mod = types.ModuleType('temporalio.client')
+class Client:
+    def __init__(self, *args, **kwargs):
+        pass
+    @staticmethod
+    async def connect(*args, **kwargs):
+        pass
+client_mod.Client = Client
+
+for name, mod in [('activity', activity_mod), ('workflow', workflow_mod), ('common', common_mod),
+                  ('worker', worker_mod), ('client', client_mod)]:
+    setattr(temporalio_mod, name, mod)
+    sys.modules[f'temporalio.{name}'] = mod
+sys.modules['temporalio'] = temporalio_mod
+
+# Tests must never reach the OpenAI API; the client imports the SDK lazily, so a stub suffices.
+# The error types are real classes so openai_client's isinstance checks work against them
+openai_mod = types.ModuleType('openai')
+for name in ('RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError',
+             'BadRequestError', 'AuthenticationError', 'NotFoundError'):
+    setattr(openai_mod, name, type(name, (Exception,), {}))
+openai_mod.OpenAI = MagicMock()
+openai_mod.AsyncOpenAI = MagicMock()
+sys.modules['openai'] = openai_mod
@@ -1,69 +1,66 @@
-import sys
-import types
 import unittest
 from unittest.mock import patch, MagicMock, AsyncMock
-from pydantic import BaseModel
+from shared import ReportDetails, EnrichedReportDetails
 
-# Create a real in-memory shared module with minimal stubs
-shared_mod = types.ModuleType('shared')
-class ReportDetails(BaseModel):
-    source_account_id: str = "stub"
-    timestamp: str = "stub"
-    latitude: float = 0.0
-    longitude: float = 0.0
-    picture_url: str = "stub"
-    vessel_registry: str = None
-class EnrichedReportDetails(ReportDetails):
-    report_number: str = None
-    trust_score: float = None
-    ais_neighbours: list = None
-    visibility: int = 1
-setattr(shared_mod, 'ReportDetails', ReportDetails)
-setattr(shared_mod, 'EnrichedReportDetails', EnrichedReportDetails)
-sys.modules['shared'] = shared_mod
-
-# Patch only the essential external dependencies
-sys.modules['temporalio'] = types.ModuleType('temporalio')
-temporalio_activity_mod = types.ModuleType('temporalio.activity')
-def no_op_decorator(f):
-    return f
-temporalio_activity_mod.defn = no_op_decorator
-sys.modules['temporalio.activity'] = temporalio_activity_mod
+import numpy as np
 
 import importlib
 activities = importlib.import_module('temporals.base.activities')
+db_utils = importlib.import_module('db_utils')
 
 class TestActivities(unittest.IsolatedAsyncioTestCase):
     async def test_assign_report_number(self):
-        with patch('random.randint', return_value=12345):
+        expected = np.random.default_rng(42).integers(10000, 100000, db_utils.REPORT_NUMBER_BLOCK)
+        with patch.object(db_utils, '_rng', np.random.default_rng(42)), patch.object(db_utils, '_report_numbers', []):
             report = ReportDetails(latitude=1, longitude=2)
-            result = await activities.assign_report_number(report)
-            self.assertEqual(result, "AIS-12345")
+            self.assertEqual(await activities.assign_report_number(report), f"AIS-{expected[-1]}")
+            # Later numbers come from the same block
+            self.assertEqual(await activities.assign_report_number(report), f"AIS-{expected[-2]}")
+            self.assertEqual(len(db_utils._report_numbers), db_utils.REPORT_NUMBER_BLOCK - 2)
+
+    async def test_assign_report_number_refills(self):
+        with patch.object(db_utils, '_report_numbers', []):
+            numbers = [db_utils._next_report_number() for _ in range(db_utils.REPORT_NUMBER_BLOCK + 1)]
+        self.assertTrue(all(10000 <= n <= 99999 for n in numbers))
 
     async def test_calculate_trust_score(self):
-        with patch('random.uniform', return_value=0.75):
+        with patch.object(activities, 'get_trust_score', return_value=0.75) as get_trust_score:
             result = await activities.calculate_trust_score("acct")
             self.assertEqual(result, 0.75)
+            get_trust_score.assert_called_once_with("acct")
+
+    async def test_calculate_trust_score_default(self):
+        # Accounts without a stored score get the default, and metadata is stored when given
+        with patch.object(activities, 'get_trust_score', return_value=None), \
+             patch.object(activities, 'store_user_metadata') as store_user_metadata:
+            result = await activities.calculate_trust_score("acct", ip="1.2.3.4")
+            self.assertEqual(result, 0.7)
+            store_user_metadata.assert_called_once_with(ip="1.2.3.4", user_agent=None, source_account_id="acct", is_logged_in=False)
 
     async def test_calculate_visibility(self):
-        with patch('random.randint', return_value=8):
-            report = EnrichedReportDetails(latitude=0, longitude=0)
+        with patch.object(activities, 'get_visibility_for_location', return_value=8) as get_visibility:
+            report = EnrichedReportDetails(latitude=1, longitude=2)
             result = await activities.calculate_visibility(report)
             self.assertEqual(result, 8)
+            get_visibility.assert_called_once_with(1, 2)
 
     async def test_find_ais_neighbours_success(self):
-        # Patch requests.request to simulate API call
+        # Patch the shared AIS client to simulate API call
         fake_response = MagicMock()
         fake_response.raise_for_status = MagicMock()
         fake_response.json.return_value = [{"vessel_name": "ShipA"}, {"vessel_name": "ShipB"}]
-        with patch('requests.request', return_value=fake_response):
+        fake_client = MagicMock(get=AsyncMock(return_value=fake_response))
+        with patch.object(activities, '_ais_client', return_value=fake_client):
             report = EnrichedReportDetails(latitude=0, longitude=0, visibility=10)
             result = await activities.find_ais_neighbours(report)
             self.assertEqual(result, ["ShipA", "ShipB"])
+            fake_client.get.assert_awaited_once()
+            self.assertEqual(fake_client.get.call_args.kwargs["params"]["radius"], 10)
 
     async def test_find_ais_neighbours_http_error(self):
-        # Patch requests.request to raise an exception
-        with patch('requests.request', side_effect=Exception("fail")):
+        # Patch the shared AIS client to raise an exception
+        fake_client = MagicMock(get=AsyncMock(side_effect=Exception("fail")))
+        with patch.object(activities, '_ais_client', return_value=fake_client):
             report = EnrichedReportDetails(latitude=0, longitude=0, visibility=10)
             with self.assertRaises(Exception):
                 await activities.find_ais_neighbours(report)
@@ -75,5 +72,17 @@ class TestActivities(unittest.IsolatedAsyncioTestCase):
             result = await activities.convert_to_prometheus_metrics(ship)
             self.assertEqual(result, "foo_metric")
 
+    async def test_convert_to_prometheus_metrics_lines(self):
+        report = {"source_account_id": "acct", "latitude": 1.5, "longitude": 2, "timestamp": "2024-05-05T12:00:00Z",
+                  "report_number": "R-1", "trust_score": 0.7, "enriched_description": 'a "b"'}
+        result = await activities._convert_to_prometheus_metrics(report)
+        labels = 'source_account_id="acct",latitude="1.5",longitude="2"'
+        self.assertEqual(result.split("\n"), [
+            f'ship_trust_score{{{labels},report_number="R-1",stage="final",enriched="true",timestamp="1714910400000"}} 0.7',
+            f'ship_report_number_total{{{labels},stage="final",enriched="true",timestamp="1714910400000"}} 1',
+            f'ship_description_length{{{labels},stage="final",enriched="true",timestamp="1714910400000"}} 5',
+            f'ship_llm_enrichment{{{labels},report_number="R-1",stage="final",enriched="true",description="a \\"b\\"",timestamp="1714910400000"}} 1',
+        ])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.testclient import TestClient
+
+import importlib
+main = importlib.import_module('main')
+
+HEADER = "MMSI,BaseDateTime,LAT,LON,SOG,COG,Heading,VesselName,IMO,CallSign,VesselType,Status,Length,Width,Draft,Cargo,TransceiverClass"
+LATEST_TIME = pd.Timestamp("2024-05-05 12:00:00")
+# (MMSI, latest position, minutes before LATEST_TIME of the latest record)
+SHIPS = [
+    ("366000001", (10.12345, 179.98765), 0), # East of the antimeridian...
+    ("366000002", (10.12340, -179.98760), 5), # ...and 2.7 km away, west of it
+    ("366000003", (10.5, 0.5), 10),
+    ("366000004", (10.12345, 179.98765), 180), # Outside the default 60 minute window
+]
+
+def write_csv(path):
+    """Two hours of track per ship, a record every 30 seconds, drifting north to its latest position."""
+    lines = [HEADER]
+    for n, (mmsi, (lat, lon), minutes_ago) in enumerate(SHIPS):
+        latest = LATEST_TIME - pd.Timedelta(minutes=minutes_ago)
+        for step in range(240, -1, -1):
+            timestamp = (latest - pd.Timedelta(seconds=30 * step)).isoformat()
+            lines.append(f"{mmsi},{timestamp},{lat - step * 1e-4:.5f},{lon},11.7,209.1,348,SHIP {n},IMO900000{n},CS{n},70,0,252.0,20.0,7.5,,A")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+class TestShips(unittest.TestCase):
+    """Regression tests of /ships on a small synthetic CSV."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.csv_path = os.path.join(cls.tmp_dir, "ais.csv")
+        write_csv(cls.csv_path)
+        # TestClient runs startup in a worker thread; Numba's TBB threading layer hangs the interpreter
+        # at exit unless it was first used on the main thread, as it is under uvicorn
+        main._decimate_tracks(np.zeros(1, dtype=np.int32), np.array([0, 1]), main.MIN_TAIL_GAP_S)
+        # A fixed clock at load makes simulated timestamps, and so whole bodies, comparable across loads
+        cls.now = pd.Timestamp.now('UTC')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def setUp(self):
+        patchers = [
+            patch.object(main, 'CSV_FILE_PATH', self.csv_path),
+            patch.object(main, 'SHIP_BUILD_WORKERS', 1),
+            patch.object(main.pd.Timestamp, 'utcnow', return_value=self.now),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_ships(self, **params):
+        """Starts the app, which loads the CSV or its prepared cache, and queries /ships."""
+        with TestClient(main.app) as client:
+            return client.get("/ships", params=params)
+
+    def test_cold_and_warm_load_agree(self):
+        shutil.rmtree(main.prepared_cache_dir(self.csv_path), ignore_errors=True)
+        cold = self.get_ships(lat=10.2, lon=90, radius=20000)
+        self.assertTrue(os.path.exists(os.path.join(main.prepared_cache_dir(self.csv_path), "meta.json")))
+        with patch.object(main, 'prepare_from_csv') as prepare_from_csv:
+            warm = self.get_ships(lat=10.2, lon=90, radius=20000)
+        prepare_from_csv.assert_not_called()
+        self.assertEqual(cold.status_code, 200)
+        self.assertEqual(cold.content, warm.content)
+
+        ships = orjson.loads(cold.content)
+        self.assertEqual([ship["mmsi"] for ship in ships], ["366000001", "366000002", "366000003"])
+        ship = ships[0]
+        self.assertEqual((ship["latest_lat"], ship["latest_lon"], ship["vessel_type"], ship["cargo"]),
+                         (10.12345, 179.98765, 70, None))
+        # A day's tail of a two hour track, decimated to a point a minute, ending at the latest position
+        self.assertEqual(len(ship["tail"]), 121)
+        self.assertEqual((ship["tail"][-1]["lat"], ship["tail"][-1]["lon"]), (10.12345, 179.98765))
+        self.assertEqual(ship["tail"][-1]["timestamp"], ship["latest_timestamp"])
+        self.assertEqual(ship["tail"][0]["lat"], 10.09945)
+
+    def test_tail_hours(self):
+        ships = orjson.loads(self.get_ships(lat=10.12, lon=179.99, radius=5, tail_hours=0.5).content)
+        self.assertEqual([len(ship["tail"]) for ship in ships], [31, 31])
+
+    def test_radius_across_antimeridian(self):
+        # Small radii are answered from the grid, large ones from the KD-tree and haversine
+        for radius in (5, 1000):
+            for lon in (179.999, -179.999):
+                with self.subTest(radius=radius, lon=lon):
+                    ships = orjson.loads(self.get_ships(lat=10.12, lon=lon, radius=radius).content)
+                    self.assertEqual([ship["mmsi"] for ship in ships], ["366000001", "366000002"])
+                    self.assertTrue(all(ship["distance_km"] < 5 for ship in ships))
+
+    def test_no_ships(self):
+        self.assertEqual(self.get_ships(lat=-40, lon=179.99, radius=5).status_code, 404)
+
+    def test_process_pool(self):
+        expected = self.get_ships(lat=10.12, lon=179.99, radius=5).content
+        with patch.object(main, 'SHIP_BUILD_WORKERS', 2):
+            with TestClient(main.app) as client:
+                self.assertIsInstance(main.ship_build_pool, ProcessPoolExecutor)
+                self.assertEqual(client.get("/ships", params={"lat": 10.12, "lon": 179.99, "radius": 5}).content, expected)
+
+    def test_pool_falls_back_to_threads(self):
+        # Without a prepared cache the worker processes cannot load, so the pool uses threads
+        path = os.path.join(self.tmp_dir, "unprepared.csv")
+        shutil.copy(self.csv_path, path)
+        with patch.object(main, 'SHIP_BUILD_WORKERS', 2):
+            pool = main.create_ship_build_pool(path)
+        self.addCleanup(pool.shutdown)
+        self.assertIsInstance(pool, ThreadPoolExecutor)
+
+    def test_broken_pool_is_replaced(self):
+        class BrokenPool(Executor):
+            def submit(self, fn, *args, **kwargs):
+                raise BrokenProcessPool("A worker died")
+
+        expected = self.get_ships(lat=10.12, lon=179.99, radius=5).content
+        with TestClient(main.app) as client:
+            with patch.object(main, 'ship_build_pool', BrokenPool()), \
+                 patch.object(main, 'create_ship_build_pool', return_value=ThreadPoolExecutor(1)) as create_ship_build_pool:
+                response = client.get("/ships", params={"lat": 10.12, "lon": 179.99, "radius": 5})
+                self.assertIs(main.ship_build_pool, create_ship_build_pool.return_value)
+            create_ship_build_pool.return_value.shutdown()
+        create_ship_build_pool.assert_called_once_with(self.csv_path)
+        self.assertEqual(response.content, expected)
+
+if __name__ == "__main__":
+    unittest.main()
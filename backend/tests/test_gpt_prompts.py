@@ -0,0 +1,100 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import importlib
+gpt_prompts = importlib.import_module('gpt_prompts')
+openai_client = importlib.import_module('openai_client')
+
+class TestThrottle(unittest.IsolatedAsyncioTestCase):
+    async def test_acquire(self):
+        clock = [0.0]
+        async def fake_sleep(seconds):
+            clock[0] += seconds
+        with patch.object(gpt_prompts.time, 'monotonic', side_effect=lambda: clock[0]), \
+             patch.object(gpt_prompts.asyncio, 'sleep', new=AsyncMock(side_effect=fake_sleep)) as sleep:
+            throttle = gpt_prompts._Throttle(60)
+            # The bucket starts full
+            await throttle.acquire(60)
+            sleep.assert_not_awaited()
+            # ...and refills at one unit per second
+            await throttle.acquire(2)
+            self.assertEqual(clock[0], 2.0)
+            # Requests larger than the bucket wait for a full bucket rather than forever
+            await throttle.acquire(100)
+            self.assertEqual(clock[0], 62.0)
+
+class TestBulk(unittest.IsolatedAsyncioTestCase):
+    async def test_complete_bulk_preserves_order(self):
+        with patch.object(gpt_prompts, 'chat_completion', new=AsyncMock(side_effect=lambda prompt, **kwargs: prompt.upper())):
+            result = await gpt_prompts._complete_bulk(["a", "b", "c"], "sys", max_concurrent_requests=2)
+        self.assertEqual(result, ["A", "B", "C"])
+
+class TestBatchReports(unittest.IsolatedAsyncioTestCase):
+    async def test_complete_batch_orders_by_custom_id(self):
+        async def fake_await_batch(batch_id):
+            for pair in (("2", "c"), ("0", "a"), ("1", None)):
+                yield pair
+        with patch.object(gpt_prompts, 'submit_reports_batch', new=AsyncMock(return_value="batch")) as submit, \
+             patch.object(gpt_prompts, 'await_batch', new=fake_await_batch):
+            result = await gpt_prompts._complete_batch(["pa", "pb", "pc", "pd"], "sys")
+        # Requests missing from the output count as failed
+        self.assertEqual(result, ["a", None, "c", None])
+        submit.assert_awaited_once_with(["pa", "pb", "pc", "pd"], temperature=gpt_prompts.REPORT_TEMPERATURE, system_message="sys")
+
+class TestReports(unittest.IsolatedAsyncioTestCase):
+    async def test_repeated_report_is_cached(self):
+        openai_client._response_cache.clear()
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(return_value=SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="report"))]))
+        with patch.object(openai_client, 'get_async_client', return_value=client):
+            self.assertEqual(await gpt_prompts.generate_event_report({"mmsi": "1", "lat": 2}), "report")
+            # Same payload with a different key order
+            self.assertEqual(await gpt_prompts.generate_event_report({"lat": 2, "mmsi": "1"}), "report")
+        client.chat.completions.create.assert_awaited_once()
+        self.assertEqual(client.chat.completions.create.call_args.kwargs["temperature"], gpt_prompts.REPORT_TEMPERATURE)
+
+class TestSystemMessages(unittest.IsolatedAsyncioTestCase):
+    async def test_instructions_go_in_the_system_message(self):
+        with patch.object(gpt_prompts, 'chat_completion', new=AsyncMock(return_value="report")) as chat_completion:
+            await gpt_prompts.generate_event_report("incident")
+            await gpt_prompts.generate_vessel_report("vessel")
+        (event_prompt,), event_kwargs = chat_completion.call_args_list[0]
+        (vessel_prompt,), vessel_kwargs = chat_completion.call_args_list[1]
+        self.assertEqual(event_kwargs["system_message"], gpt_prompts.SYSTEM_EVENT)
+        self.assertEqual(vessel_kwargs["system_message"], gpt_prompts.SYSTEM_VESSEL)
+        # The user message only carries the data
+        self.assertEqual(event_prompt.strip(), "Incident Data:\nincident")
+        self.assertEqual(vessel_prompt.strip(), "Vessel Data:\nvessel")
+
+class TestTemplates(unittest.TestCase):
+    def test_prompts_match_templates(self):
+        self.assertEqual(gpt_prompts._event_prompt("x"), gpt_prompts._PROMPTS["event_report"].format(incident_data="x"))
+        self.assertEqual(gpt_prompts._vessel_prompt("x"), gpt_prompts._PROMPTS["vessel_report"].format(vessel_data="x"))
+
+    def test_braces_in_data_are_kept(self):
+        # Concatenation, unlike str.format, leaves braces in the data alone
+        self.assertIn('{"name": "{x}"}', gpt_prompts._vessel_prompt('{"name": "{x}"}'))
+
+class TestReportStreams(unittest.IsolatedAsyncioTestCase):
+    async def test_report_streams(self):
+        async def fake_stream(prompt, **kwargs):
+            for delta in ("a", "b"):
+                yield delta
+        with patch.object(gpt_prompts, 'chat_completion_stream', side_effect=fake_stream) as chat_completion_stream:
+            self.assertEqual([d async for d in gpt_prompts.generate_event_report_stream("incident")], ["a", "b"])
+            self.assertEqual([d async for d in gpt_prompts.generate_vessel_report_stream("vessel")], ["a", "b"])
+        self.assertEqual(chat_completion_stream.call_args_list[0].kwargs["system_message"], gpt_prompts.SYSTEM_EVENT)
+        self.assertEqual(chat_completion_stream.call_args_list[1].kwargs["system_message"], gpt_prompts.SYSTEM_VESSEL)
+
+class TestPayloads(unittest.TestCase):
+    def test_dict_payloads_are_sorted_compact_json(self):
+        self.assertEqual(gpt_prompts._payload({"b": 1, "a": "x"}), '{"a":"x","b":1}')
+        self.assertIn('{"a":"x","b":1}', gpt_prompts._event_prompt({"b": 1, "a": "x"}))
+
+    def test_string_payloads_pass_through(self):
+        self.assertEqual(gpt_prompts._payload('{"b": 1}'), '{"b": 1}')
+
+if __name__ == "__main__":
+    unittest.main()
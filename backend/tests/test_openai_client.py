@@ -0,0 +1,235 @@
+import asyncio
+import json
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock, AsyncMock
+
+import httpx
+import numpy as np
+import openai
+
+import importlib
+openai_client = importlib.import_module('openai_client')
+
+def fake_completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def fake_client(*replies):
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=[fake_completion(reply) for reply in replies])
+    return client
+
+def fake_embedding(vector):
+    return SimpleNamespace(data=[SimpleNamespace(embedding=vector)])
+
+async def fake_stream(*deltas):
+    # A final usage chunk has no choices
+    for delta in deltas:
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+    yield SimpleNamespace(choices=[])
+
+class TestCacheKeys(unittest.TestCase):
+    def test_normalize(self):
+        prompt = ('{"url":"https://example.com/a.jpg","ts":"2024-05-05T12:00:00Z",'
+                  '"id":"123e4567-e89b-12d3-a456-426614174000"}')
+        self.assertEqual(openai_client._normalize(prompt), '{"url":"<url>","ts":"<ts>","id":"<id>"}')
+
+    def test_cache_key_ignores_volatile_values(self):
+        key = openai_client._cache_key("at 2024-05-05T12:00:00Z see http://a/1", "m", 0, "sys", 10)
+        self.assertEqual(key, openai_client._cache_key("at 2024-06-01T08:30:00+02:00 see http://b/2", "m", 0, "sys", 10))
+        self.assertNotEqual(key, openai_client._cache_key("at 2024-05-05T12:00:00Z see http://a/1", "m", 0.5, "sys", 10))
+        self.assertNotEqual(key, openai_client._cache_key("at 2024-05-05T12:00:00Z see http://a/1", "m", 0, "sys", 20))
+
+class TestErrorHandling(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        openai_client._breaker.close()
+
+    def test_is_retryable(self):
+        for error in (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError):
+            self.assertTrue(openai_client._is_retryable(error()))
+        for error in (openai.BadRequestError, openai.AuthenticationError, openai.NotFoundError, asyncio.CancelledError):
+            self.assertFalse(openai_client._is_retryable(error()))
+            self.assertTrue(openai_client._is_permanent(error()))
+
+    async def test_breaker_ignores_permanent_errors(self):
+        fake_client = MagicMock()
+        for error in (openai.AuthenticationError, openai.BadRequestError, asyncio.CancelledError):
+            fake_client.chat.completions.create = AsyncMock(side_effect=error())
+            with patch.object(openai_client, 'get_async_client', return_value=fake_client):
+                with self.assertRaises(error):
+                    await openai_client._create_completion(model="m", messages=[])
+            fake_client.chat.completions.create.assert_awaited_once()
+        self.assertEqual(openai_client._breaker.fail_counter, 0)
+
+    def test_breaker_counts_transient_errors(self):
+        with self.assertRaises(openai.RateLimitError):
+            with openai_client._breaker.calling():
+                raise openai.RateLimitError()
+        self.assertEqual(openai_client._breaker.fail_counter, 1)
+
+class TestChatCompletion(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = fake_client("first", "second")
+        self.patcher = patch.object(openai_client, 'get_async_client', return_value=self.client)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    async def test_chat_completion(self):
+        reply = await openai_client.chat_completion("hi", model="m", temperature=0.7, system_message="sys", max_tokens=5)
+        self.assertEqual(reply, "first")
+        self.client.chat.completions.create.assert_awaited_once_with(
+            model="m", messages=[{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}],
+            temperature=0.7, max_tokens=5)
+
+    async def test_no_cache_when_sampling(self):
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0.7), "first")
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0.7), "second")
+
+class TestClients(unittest.TestCase):
+    def setUp(self):
+        openai_client.get_async_client.cache_clear()
+
+    def tearDown(self):
+        openai_client.get_async_client.cache_clear()
+
+    def test_async_client_is_shared(self):
+        with patch.object(openai, 'AsyncOpenAI') as async_openai, patch.object(openai_client, '_api_key', return_value="key"):
+            client = openai_client.get_async_client()
+            self.assertIs(openai_client.get_async_client(), client)
+        async_openai.assert_called_once()
+        self.assertEqual(async_openai.call_args.kwargs["api_key"], "key")
+        self.assertIsInstance(async_openai.call_args.kwargs["http_client"], httpx.AsyncClient)
+
+class TestBatch(unittest.IsolatedAsyncioTestCase):
+    async def test_submit_reports_batch(self):
+        client = MagicMock()
+        client.files.create = AsyncMock(return_value=SimpleNamespace(id="file"))
+        client.batches.create = AsyncMock(return_value=SimpleNamespace(id="batch"))
+        with patch.object(openai_client, 'get_async_client', return_value=client):
+            batch_id = await openai_client.submit_reports_batch(["a", "b"], model="m", temperature=0, system_message="sys")
+        self.assertEqual(batch_id, "batch")
+        lines = [json.loads(line) for line in client.files.create.call_args.kwargs["file"][1].getvalue().splitlines()]
+        self.assertEqual([line["custom_id"] for line in lines], ["0", "1"])
+        self.assertEqual(lines[1]["body"]["messages"], [{"role": "system", "content": "sys"}, {"role": "user", "content": "b"}])
+        self.assertEqual((lines[0]["body"]["model"], lines[0]["body"]["temperature"]), ("m", 0))
+        client.batches.create.assert_awaited_once_with(input_file_id="file", endpoint=openai_client.BATCH_ENDPOINT,
+                                                       completion_window="24h")
+
+    async def test_await_batch(self):
+        output = "\n".join([
+            '{"custom_id": "2", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "c"}}]}}}',
+            '{"custom_id": "0", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "a"}}]}}}',
+        ])
+        errors = "\n".join([
+            '{"custom_id": "1", "response": {"status_code": 400, "body": {"error": {"message": "bad"}}}, "error": null}',
+            '{"custom_id": "3", "response": null, "error": {"code": "server_error", "message": "boom"}}',
+        ])
+        files = {"out": output, "err": errors}
+        client = MagicMock()
+        client.batches.retrieve = AsyncMock(side_effect=[SimpleNamespace(status="in_progress"),
+                                                         SimpleNamespace(status="completed", output_file_id="out", error_file_id="err")])
+        client.files.content = AsyncMock(side_effect=lambda file_id: SimpleNamespace(text=files[file_id]))
+        with patch.object(openai_client, 'get_async_client', return_value=client), self.assertLogs(level="WARNING") as logs:
+            result = [pair async for pair in openai_client.await_batch("batch", poll_interval=0)]
+        self.assertEqual(result, [("2", "c"), ("0", "a"), ("1", None), ("3", None)])
+        self.assertIn("boom", logs.output[-1])
+
+    async def test_await_batch_all_failed(self):
+        client = MagicMock()
+        client.batches.retrieve = AsyncMock(return_value=SimpleNamespace(status="completed", output_file_id=None, error_file_id="err"))
+        client.files.content = AsyncMock(return_value=SimpleNamespace(
+            text='{"custom_id": "0", "response": {"status_code": 500, "body": {}}, "error": null}'))
+        with patch.object(openai_client, 'get_async_client', return_value=client), self.assertLogs(level="WARNING"):
+            result = [pair async for pair in openai_client.await_batch("batch", poll_interval=0)]
+        self.assertEqual(result, [("0", None)])
+
+    async def test_await_batch_failed(self):
+        client = MagicMock()
+        client.batches.retrieve = AsyncMock(return_value=SimpleNamespace(status="expired"))
+        with patch.object(openai_client, 'get_async_client', return_value=client):
+            with self.assertRaises(RuntimeError):
+                [pair async for pair in openai_client.await_batch("batch", poll_interval=0)]
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        openai_client._response_cache.clear()
+        self.client = fake_client("first", "second")
+        self.patcher = patch.object(openai_client, 'get_async_client', return_value=self.client)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    async def test_exact_cache_when_deterministic(self):
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0), "first")
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0), "first")
+        self.client.chat.completions.create.assert_awaited_once()
+
+    async def test_cache_override(self):
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0, cache=False), "first")
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0.7, cache=True), "second")
+        self.assertEqual(await openai_client.chat_completion("hi", model="m", temperature=0.7, cache=True), "second")
+
+class TestSemanticCache(unittest.IsolatedAsyncioTestCase):
+    def test_lookup_threshold(self):
+        cache = openai_client._SemanticCache(threshold=0.9, maxsize=4)
+        self.assertIsNone(cache.lookup(np.array([1.0, 0.0], dtype=np.float32)))
+        cache.add(np.array([1.0, 0.0], dtype=np.float32), "east")
+        self.assertEqual(cache.lookup(np.array([0.99, 0.141], dtype=np.float32)), "east")
+        self.assertIsNone(cache.lookup(np.array([0.0, 1.0], dtype=np.float32)))
+
+    def test_ring_buffer_evicts_oldest(self):
+        cache = openai_client._SemanticCache(threshold=0.9, maxsize=2)
+        for vector, reply in (([1.0, 0.0], "east"), ([0.0, 1.0], "north"), ([-1.0, 0.0], "west")):
+            cache.add(np.array(vector, dtype=np.float32), reply)
+        self.assertEqual(cache.size, 2)
+        self.assertIsNone(cache.lookup(np.array([1.0, 0.0], dtype=np.float32)))
+        self.assertEqual(cache.lookup(np.array([0.0, 1.0], dtype=np.float32)), "north")
+        self.assertEqual(cache.lookup(np.array([-1.0, 0.0], dtype=np.float32)), "west")
+
+    async def test_semantic_cache(self):
+        openai_client._response_cache.clear()
+        openai_client._semantic_caches.clear()
+        client = fake_client("first", "second")
+        client.embeddings.create = AsyncMock(side_effect=[fake_embedding([3.0, 4.0]), fake_embedding([3.0, 4.1]),
+                                                          fake_embedding([4.0, -3.0])])
+        with patch.object(openai_client, 'get_async_client', return_value=client):
+            self.assertEqual(await openai_client.chat_completion("ship a", model="m", temperature=0, semantic_cache=True), "first")
+            # A different prompt with a near-identical embedding reuses the reply
+            self.assertEqual(await openai_client.chat_completion("ship b", model="m", temperature=0, semantic_cache=True), "first")
+            self.assertEqual(await openai_client.chat_completion("ship c", model="m", temperature=0, semantic_cache=True), "second")
+        self.assertEqual(client.chat.completions.create.await_count, 2)
+
+class TestLazyEnv(unittest.TestCase):
+    def setUp(self):
+        for cached in (openai_client._load_env, openai_client._api_key, openai_client._default_model):
+            cached.cache_clear()
+
+    tearDown = setUp
+
+    def test_env_is_loaded_once_on_first_use(self):
+        with patch.object(openai_client, 'load_dotenv') as load_dotenv, \
+             patch.dict(os.environ, {"OPENAI_API_KEY": "key", "OPENAI_MODEL": "model"}):
+            load_dotenv.assert_not_called()
+            self.assertEqual(openai_client._api_key(), "key")
+            self.assertEqual(openai_client._default_model(), "model")
+        load_dotenv.assert_called_once()
+
+    def test_default_model(self):
+        with patch.object(openai_client, 'load_dotenv'), patch.dict(os.environ, clear=True):
+            self.assertEqual(openai_client._default_model(), openai_client.DEFAULT_MODEL)
+
+class TestStreaming(unittest.IsolatedAsyncioTestCase):
+    async def test_chat_completion_stream(self):
+        client = MagicMock()
+        client.chat.completions.create = AsyncMock(return_value=fake_stream("Hel", None, "lo"))
+        with patch.object(openai_client, 'get_async_client', return_value=client):
+            deltas = [delta async for delta in openai_client.chat_completion_stream("hi", model="m")]
+        self.assertEqual(deltas, ["Hel", "", "lo"])
+        self.assertTrue(client.chat.completions.create.call_args.kwargs["stream"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,31 +1,8 @@
 import unittest
-from unittest.mock import patch, MagicMock
-import sys
-from pydantic import BaseModel
-
-# Minimal stub Pydantic models to satisfy FastAPI
-class ReportDetails(BaseModel):
-    source_account_id: str = "stub"
-    timestamp: str = "stub"
-    location: str = "stub"
-    picture_url: str = "stub"
-
-class EnrichedReportDetails(BaseModel):
-    pass
-
-# Patch sys.modules for all external dependencies before importing server
-sys.modules['temporalio'] = MagicMock()
-sys.modules['temporalio.client'] = MagicMock()
-sys.modules['workflow'] = MagicMock()
-# Patch shared to include our stub models
-shared_mock = MagicMock()
-shared_mock.ReportDetails = ReportDetails
-shared_mock.EnrichedReportDetails = EnrichedReportDetails
-sys.modules['shared'] = shared_mock
-sys.modules['activities'] = MagicMock()
+from unittest.mock import patch
 from temporals.base import server
 
-class TestServer(unittest.TestCase):
+class TestServer(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         # Patch dependencies and global lists
         self.patcher_initial = patch('temporals.base.server.initial_metrics', [])
@@ -37,7 +14,7 @@ class TestServer(unittest.TestCase):
         self.patcher_initial.stop()
         self.patcher_final.stop()
 
-    def test_get_metrics_empty(self):
+    async def test_get_metrics_empty(self):
         # Test the /metrics endpoint logic with empty metrics
         expected = (
             '# HELP ship_trust_score Trust score for ships\n'
@@ -46,13 +23,10 @@ class TestServer(unittest.TestCase):
             '# TYPE ship_ais_number_total counter\n'
         )
         expected += '\n'.join([] + [])
-        result = server.get_metrics()
-        # Since get_metrics is async, run it with asyncio.run
-        import asyncio
-        output = asyncio.run(result)
+        output = await server.get_metrics()
         self.assertEqual(output, expected)
 
-    def test_get_metrics_with_data(self):
+    async def test_get_metrics_with_data(self):
         # Simulate some metrics
         with patch('temporals.base.server.initial_metrics', ['foo']), \
              patch('temporals.base.server.final_metrics', ['bar']):
@@ -63,9 +37,7 @@ class TestServer(unittest.TestCase):
                 '# TYPE ship_ais_number_total counter\n'
             )
             expected += '\n'.join(['foo', 'bar'])
-            result = server.get_metrics()
-            import asyncio
-            output = asyncio.run(result)
+            output = await server.get_metrics()
             self.assertEqual(output, expected)
 
 if __name__ == "__main__":
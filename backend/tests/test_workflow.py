@@ -1,43 +1,7 @@
-import sys
-import types
+import asyncio
 import unittest
-from unittest.mock import patch, AsyncMock, MagicMock
-from pydantic import BaseModel
-
-# Create a real in-memory shared module with minimal stubs
-shared_mod = types.ModuleType('shared')
-class ReportDetails(BaseModel):
-    source_account_id: str = "stub"
-    timestamp: str = "stub"
-    latitude: float = 0.0
-    longitude: float = 0.0
-    picture_url: str = "stub"
-    vessel_registry: str = None
-class EnrichedReportDetails(ReportDetails):
-    report_number: str = None
-    trust_score: float = None
-    ais_neighbours: list = None
-    visibility: int = 1
-setattr(shared_mod, 'ReportDetails', ReportDetails)
-setattr(shared_mod, 'EnrichedReportDetails', EnrichedReportDetails)
-sys.modules['shared'] = shared_mod
-
-# Patch only the essential external dependencies
-sys.modules['temporalio'] = types.ModuleType('temporalio')
-temporalio_workflow_mod = types.ModuleType('temporalio.workflow')
-def no_op_decorator(f):
-    return f
-temporalio_workflow_mod.defn = no_op_decorator
-temporalio_workflow_mod.run = no_op_decorator
-temporalio_workflow_mod.query = no_op_decorator
-sys.modules['temporalio.workflow'] = temporalio_workflow_mod
-# Add a dummy RetryPolicy to temporalio.common
-common_mod = types.ModuleType('temporalio.common')
-class RetryPolicy:
-    def __init__(self, *args, **kwargs):
-        pass
-setattr(common_mod, 'RetryPolicy', RetryPolicy)
-sys.modules['temporalio.common'] = common_mod
+from unittest.mock import patch, MagicMock, AsyncMock
+from shared import ReportDetails
 
 import importlib
 workflow_mod = importlib.import_module('temporals.base.workflow')
@@ -60,7 +24,55 @@ class TestReportDetailsWorkflow(unittest.TestCase):
         ) + 'foo\nbar'
         self.assertEqual(self.workflow.get_metrics(), expected)
 
-    # The run method is async and depends on many activities; we can only test it with heavy patching or integration tests
+    def test_store_initial_metric(self):
+        handle = MagicMock(cancelled=MagicMock(return_value=False), exception=MagicMock(return_value=None),
+                           result=MagicMock(return_value='initial'))
+        self.workflow._store_initial_metric(handle)
+        self.assertEqual(self.workflow._metrics, ['initial'])
+
+    def test_store_initial_metric_failed(self):
+        handle = MagicMock(cancelled=MagicMock(return_value=False), exception=MagicMock(return_value=Exception("fail")))
+        self.workflow._store_initial_metric(handle)
+        self.assertEqual(self.workflow._metrics, [])
+
+class TestReportDetailsWorkflowRun(unittest.IsolatedAsyncioTestCase):
+    # Activity results keyed by activity name; the metric activity renders its input's stage
+    RESULTS = {"assign_report_number": "R-1", "calculate_visibility": 10, "find_ais_neighbours": ["ShipA"],
+               "calculate_trust_score": 0.5, "llm_enrich": "desc"}
+
+    async def fake_activity(self, activity, arg, **kwargs):
+        if activity.__name__ == "convert_to_prometheus_metrics":
+            return "final" if getattr(arg, "report_number", None) else "initial"
+        return self.RESULTS[activity.__name__]
+
+    async def run_workflow(self, patched: bool):
+        wf = workflow_mod.ReportDetailsWorkflow()
+        execute_activity = AsyncMock(side_effect=self.fake_activity)
+        start_activity = MagicMock(side_effect=lambda *args, **kwargs: asyncio.ensure_future(self.fake_activity(*args, **kwargs)))
+        with patch.object(workflow_mod.workflow, 'patched', create=True, return_value=patched), \
+             patch.object(workflow_mod.workflow, 'execute_activity', create=True, new=execute_activity), \
+             patch.object(workflow_mod.workflow, 'start_activity', create=True, new=start_activity):
+            result = await wf.run(ReportDetails(source_account_id="acct"))
+        self.assertEqual((result.report_number, result.visibility, result.ais_neighbours, result.trust_score, result.enriched_description),
+                         ("R-1", 10, ["ShipA"], 0.5, "desc"))
+        self.assertEqual(wf._metrics, ["initial", "final"])
+        return execute_activity, start_activity
+
+    async def test_run_patched(self):
+        execute_activity, start_activity = await self.run_workflow(patched=True)
+        # The initial metric is started without blocking, the final one awaited at the end
+        self.assertEqual([call.args[0].__name__ for call in start_activity.call_args_list], ["convert_to_prometheus_metrics"])
+        self.assertEqual(execute_activity.call_args_list[-1].args[0].__name__, "convert_to_prometheus_metrics")
+        self.assertEqual(execute_activity.await_count, 6)
+
+    async def test_run_unpatched(self):
+        execute_activity, start_activity = await self.run_workflow(patched=False)
+        # Workflows started before the patch replay the original sequential commands
+        start_activity.assert_not_called()
+        self.assertEqual([call.args[0].__name__ for call in execute_activity.call_args_list], [
+            "convert_to_prometheus_metrics", "assign_report_number", "calculate_visibility", "find_ais_neighbours",
+            "calculate_trust_score", "llm_enrich", "convert_to_prometheus_metrics",
+        ])
 
 if __name__ == "__main__":
     unittest.main()
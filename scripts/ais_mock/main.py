@@ -1,11 +1,23 @@
 # main.py
+import asyncio
+import itertools
+import json
+import multiprocessing
 import os
 import pandas as pd
 import numpy as np
+import orjson
+import pyarrow as pa
+from pyarrow import csv as pacsv
+from numba import njit, prange
+from scipy.spatial import cKDTree
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel, Field # Import Pydantic
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 import uvicorn
 import time # Import time module for timing
 
@@ -16,16 +28,50 @@ LAT_COL = "LAT"
 LON_COL = "LON"
 TIME_COL = "BaseDateTime" # Column for timestamp
 MMSI_COL = "MMSI"       # Column for ship identifier
+# Types of the essential columns, given to the CSV parser so they are converted while parsing
+# (MMSI is an identifier, so it is read as text rather than inferred as a number)
+CSV_COLUMN_TYPES = {MMSI_COL: pa.string(), TIME_COL: pa.timestamp('s'), LAT_COL: pa.float64(), LON_COL: pa.float64()}
 
 EARTH_RADIUS_KM = 6371
+MIN_TAIL_GAP_S = 60 # Tail points are at least 1 minute apart
+COORD_DECIMALS = 5 # Decimals of the source latitudes; rounding the float32 tail latitudes to this recovers them exactly
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+CHEAP_RULER_MAX_RADIUS_KM = 500 # Flat-earth distances are used up to this radius; haversine beyond
+GRID_CELL_DEG = 1.0 # Cell size of the latest-position grid
+GRID_COLS = int(round(360 / GRID_CELL_DEG))
+GRID_MAX_CELLS = 16 # Searches covering more grid cells than this use the KD-tree
+DEV_MODE = os.getenv("AIS_MOCK_DEV", "0") == "1" # Run the server with auto-reload (see the main block)
+SHIP_BUILD_WORKERS = os.cpu_count() or 1 # Workers for building response objects (processes if more than one)
+PREPARED_CACHE_SUFFIX = '.prepared' # Prepared data is cached in '<CSV_FILE_PATH>.prepared/'
+PREPARED_CACHE_VERSION = 4 # Bump when the prepared layout changes
 
 # --- Global Variables ---
-ais_data_df: Optional[pd.DataFrame] = None # Main DataFrame for initial filtering
-# --- OPTIMIZATION: Dictionary to hold pre-grouped data by MMSI ---
-ais_data_grouped_by_mmsi: Dict[str, pd.DataFrame] = {}
+# --- OPTIMIZATION: Struct-of-arrays store of every ship's decimated track (points at least
+# MIN_TAIL_GAP_S apart, precomputed at load), each track sorted by time ---
+ais_t0_ns: int = 0 # Earliest original timestamp (ns since epoch); tail_ts_s counts from here
+tail_ts_s: Optional[np.ndarray] = None # Original timestamps as int32 seconds since ais_t0_ns
+tail_lat: Optional[np.ndarray] = None # float32, see COORD_DECIMALS
+tail_lon: Optional[np.ndarray] = None # float64; float32 cannot hold 5 decimals beyond |lon| ~128
+tail_offsets: Optional[np.ndarray] = None # Points of the i-th ship are [tail_offsets[i], tail_offsets[i + 1])
+mmsi_to_idx: Dict[str, int] = {}
+# --- End Optimization ---
+# --- OPTIMIZATION: Latest record per MMSI (all columns, for the response metadata), with a KD-tree
+# over those positions for radius queries ---
+latest_records_df: Optional[pd.DataFrame] = None
+latest_ship_json: List[bytes] = [] # Static ShipData fields of each latest record as an open JSON object, encoded once at load
+latest_ts_ns: Optional[np.ndarray] = None # Original timestamps of latest_records_df as int64 ns
+latest_ts_sorted_ns: Optional[np.ndarray] = None # latest_ts_ns in time order, for binary-searching the window
+latest_lat: Optional[np.ndarray] = None
+latest_lon: Optional[np.ndarray] = None
+latest_cos_lat: Optional[np.ndarray] = None # cos(latest_lat), cached for haversine
+latest_positions_tree: Optional[cKDTree] = None # Built on unit vectors, see to_unit_vectors
+latest_positions_grid: Dict[Tuple[int, int], np.ndarray] = {} # Ship indices per grid cell, for small radii
 # --- End Optimization ---
 max_historical_time: Optional[pd.Timestamp] = None
+ship_build_pool: Optional[Executor] = None # Created at startup, see create_ship_build_pool
+ship_build_pool_lock = asyncio.Lock() # Serializes replacing a broken ship-build pool
 time_offset: Optional[pd.Timedelta] = None
+time_offset_ns: Optional[int] = None # time_offset as int64 ns, for the request hot path
 
 # --- Pydantic Models for API Response ---
 
@@ -60,80 +106,341 @@ class ShipData(BaseModel):
     cargo: Optional[str] = Field(None, description="Cargo Type code.")
     transceiver_class: Optional[str] = Field(None, description="AIS Transceiver Class.")
 
-    @classmethod
-    def from_record(cls, record: pd.Series, tail_positions: List[Position], dist: float, simulated_time: datetime):
-        """
-        Helper method to create ShipData instance from a pandas Series and tail.
-        Handles NaN values and type conversions for all optional fields.
-        """
-        data = {}
-
-        # --- Helper function for safe conversion ---
-        def safe_convert(value: Any, target_type: type) -> Optional[Any]:
-            """Converts value to target_type if not NaN/None, else returns None."""
-            if pd.isna(value):
-                return None
-            try:
-                # Handle potential edge case where integer string needs float first
-                if target_type == int and isinstance(value, float):
-                    if value.is_integer():
-                        return int(value)
-                    else:
-                        return None
-                return target_type(value)
-            except (ValueError, TypeError) as e:
-                 return None
-
-        # --- Populate data dictionary with safe conversions ---
-        data["mmsi"] = str(record.get(MMSI_COL))
-        data["latest_timestamp"] = simulated_time
-        data["latest_lat"] = record.get(LAT_COL)
-        data["latest_lon"] = record.get(LON_COL)
-        data["distance_km"] = dist
-        data["tail"] = tail_positions
-
-        # Optional Floats
-        data["sog"] = safe_convert(record.get("SOG"), float)
-        data["cog"] = safe_convert(record.get("COG"), float)
-        data["heading"] = safe_convert(record.get("Heading"), float)
-        data["length"] = safe_convert(record.get("Length"), float)
-        data["width"] = safe_convert(record.get("Width"), float)
-        data["draft"] = safe_convert(record.get("Draft"), float)
-
-        # Optional Integers
-        data["vessel_type"] = safe_convert(record.get("VesselType"), int)
-        data["status"] = safe_convert(record.get("Status"), int)
-
-        # Optional Strings
-        data["vessel_name"] = safe_convert(record.get("VesselName"), str)
-        data["imo"] = safe_convert(record.get("IMO"), str)
-        data["call_sign"] = safe_convert(record.get("CallSign"), str)
-        data["cargo"] = safe_convert(record.get("Cargo"), str)
-        data["transceiver_class"] = safe_convert(record.get("TransceiverClass"), str)
-
-        # Pydantic will perform final validation based on the model definition
-        return cls(**data)
-
     class Config:
         orm_mode = True
 
 
 # --- Helper Functions ---
 
-def haversine(lat1: float, lon1: float, lat2: pd.Series, lon2: pd.Series) -> pd.Series:
-    """Calculates the great-circle distance in kilometers."""
-    lon1_rad, lat1_rad, lon2_rad, lat2_rad = map(np.radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-    a = np.sin(dlat / 2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-    distance_km = EARTH_RADIUS_KM * c
+@njit(fastmath=True, cache=True)
+def haversine(lat1: float, lon1: float, lat2: np.ndarray, lon2: np.ndarray, cos_lat2: np.ndarray) -> np.ndarray:
+    """
+    Calculates the great-circle distance in kilometers. cos_lat2 is the cosine of each lat2,
+    which is constant per ship and cached at load.
+    Compiled with Numba. It runs per request over a few candidate ships, so it is serial: a
+    parallel kernel only adds thread start-up there, and Numba's TBB threading layer hangs the
+    interpreter at exit once a parallel kernel has run off the main thread.
+    """
+    lat1_rad, lon1_rad = np.radians(lat1), np.radians(lon1)
+    cos_lat1 = np.cos(lat1_rad)
+    distance_km = np.empty(lat2.shape[0])
+    for i in range(lat2.shape[0]):
+        lat2_rad, lon2_rad = np.radians(lat2[i]), np.radians(lon2[i])
+        a = np.sin((lat2_rad - lat1_rad) / 2)**2 + cos_lat1 * cos_lat2[i] * np.sin((lon2_rad - lon1_rad) / 2)**2
+        distance_km[i] = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(min(a, 1.0))) # fastmath rounding can push a past 1
     return distance_km
 
+# Optional ShipData fields and their source columns, grouped by target type
+FLOAT_FIELDS = {"sog": "SOG", "cog": "COG", "heading": "Heading", "length": "Length", "width": "Width", "draft": "Draft"}
+INT_FIELDS = {"vessel_type": "VesselType", "status": "Status"}
+STRING_FIELDS = {"vessel_name": "VesselName", "imo": "IMO", "call_sign": "CallSign", "cargo": "Cargo", "transceiver_class": "TransceiverClass"}
+
+def ship_fields_from_records(records: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Converts latest records into ShipData field dicts, one column at a time.
+    Missing columns become None, as do missing strings and non-integral values in integer fields.
+    Float fields keep NaN, which orjson encodes as null.
+    """
+    missing = [None] * len(records)
+    columns: Dict[str, list] = {
+        "mmsi": records[MMSI_COL].astype(str).tolist(),
+        "latest_lat": records[LAT_COL].tolist(),
+        "latest_lon": records[LON_COL].tolist(),
+    }
+    for field, col in FLOAT_FIELDS.items():
+        if col not in records:
+            columns[field] = missing
+            continue
+        columns[field] = pd.to_numeric(records[col], errors='coerce').to_numpy(dtype=np.float64).tolist()
+    for field, col in INT_FIELDS.items():
+        if col not in records:
+            columns[field] = missing
+            continue
+        values = pd.to_numeric(records[col], errors='coerce')
+        valid = values.notna() & (values % 1 == 0)
+        columns[field] = values.where(valid).astype('Int64').astype(object).where(valid, None).tolist()
+    for field, col in STRING_FIELDS.items():
+        if col not in records:
+            columns[field] = missing
+            continue
+        values = records[col]
+        columns[field] = values.astype(str).astype(object).where(values.notna(), None).tolist()
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def search_box(lat0: float, radius_km: float) -> Tuple[float, float]:
+    """
+    Half-widths in degrees (lat, lon) of a box around a search circle centred at latitude lat0.
+    The longitude half-width is taken at the circle's poleward edge (where a degree of longitude
+    is shortest), so the box never excludes a point inside the circle; it is inf at the poles.
+    """
+    max_dlat = radius_km / KM_PER_DEGREE
+    edge_cos = np.cos(np.radians(min(abs(lat0) + max_dlat, 90.0)))
+    max_dlon = max_dlat / edge_cos if edge_cos > 1e-9 else np.inf
+    return max_dlat, max_dlon
+
+def cheap_distance_km(lat0: float, lon0: float, lats: np.ndarray, lons: np.ndarray, radius_km: float,
+                      cos_lats: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Distances in km from (lat0, lon0) for a radius search, using the equirectangular
+    (flat-earth) approximation on the same sphere as haversine. Points outside the search
+    circle's bounding box are skipped and get +inf. Falls back to haversine for radii
+    beyond CHEAP_RULER_MAX_RADIUS_KM, where the approximation degrades; pass the cached
+    cosines of lats as cos_lats to spare it one cosine per point.
+    """
+    if radius_km > CHEAP_RULER_MAX_RADIUS_KM:
+        lats = np.asarray(lats, dtype=np.float64)
+        if cos_lats is None:
+            cos_lats = np.cos(np.radians(lats))
+        return haversine(lat0, lon0, lats, np.asarray(lons, dtype=np.float64), np.asarray(cos_lats, dtype=np.float64))
+
+    dlat = np.asarray(lats) - lat0
+    dlon = (np.asarray(lons) - lon0 + 180.0) % 360.0 - 180.0 # Wrap across the antimeridian
+
+    max_dlat, max_dlon = search_box(lat0, radius_km)
+    candidates = np.flatnonzero((np.abs(dlat) <= max_dlat) & (np.abs(dlon) <= max_dlon))
+
+    # Only the survivors pay for a cosine and a square root
+    dlat_c, dlon_c = dlat[candidates], dlon[candidates]
+    dx = dlon_c * np.cos(np.radians(lat0 + dlat_c / 2))
+    distances = np.full(len(dlat), np.inf)
+    distances[candidates] = KM_PER_DEGREE * np.sqrt(dlat_c ** 2 + dx ** 2)
+    return distances
+
+def to_unit_vectors(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Maps positions in degrees onto the unit sphere as (x, y, z) rows. Straight-line (chord)
+    distance between these points grows monotonically with great-circle distance, so a
+    Euclidean KD-tree answers great-circle radius queries exactly.
+    """
+    lat_rad, lon_rad = np.radians(lats), np.radians(lons)
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack((cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+
+def grid_cells(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Grid cell (row, col) of each position; columns wrap so lon=180 shares a cell with lon=-180."""
+    rows = np.floor(np.asarray(lats) / GRID_CELL_DEG).astype(np.int64)
+    cols = np.floor((np.asarray(lons) + 180.0) / GRID_CELL_DEG).astype(np.int64) % GRID_COLS
+    return rows, cols
+
+def build_grid(lats: np.ndarray, lons: np.ndarray) -> Dict[Tuple[int, int], np.ndarray]:
+    """Buckets position indices by grid cell."""
+    rows, cols = grid_cells(lats, lons)
+    cells, inverse = np.unique(np.column_stack((rows, cols)), axis=0, return_inverse=True)
+    members = np.split(np.argsort(inverse, kind='stable'), np.cumsum(np.bincount(inverse))[:-1])
+    return {(int(row), int(col)): idx for (row, col), idx in zip(cells, members)}
+
+def grid_candidates(grid: Dict[Tuple[int, int], np.ndarray], lat0: float, lon0: float, radius_km: float) -> Optional[np.ndarray]:
+    """
+    Indices bucketed in the grid cells overlapping the search circle's box, or None when the
+    box covers more than GRID_MAX_CELLS cells (or reaches a pole) and the KD-tree should be used.
+    """
+    max_dlat, max_dlon = search_box(lat0, radius_km)
+    if not np.isfinite(max_dlon):
+        return None
+    (row_lo, row_hi), _ = grid_cells(np.array([lat0 - max_dlat, lat0 + max_dlat]), np.zeros(2))
+    col_lo = int(np.floor((lon0 - max_dlon + 180.0) / GRID_CELL_DEG))
+    col_hi = int(np.floor((lon0 + max_dlon + 180.0) / GRID_CELL_DEG))
+    if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > GRID_MAX_CELLS:
+        return None
+    buckets = [grid.get((int(row), col % GRID_COLS)) for row in range(row_lo, row_hi + 1) for col in range(col_lo, col_hi + 1)]
+    buckets = [bucket for bucket in buckets if bucket is not None]
+    return np.concatenate(buckets) if buckets else np.empty(0, dtype=np.intp)
+
+def chord_length(distance_km: float) -> float:
+    """Chord length on the unit sphere for a great-circle distance, with slack for rounding."""
+    angle = min(distance_km / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2) * (1 + 1e-9)
+
+@njit(parallel=True, cache=True)
+def _decimate_tracks(ts: np.ndarray, offsets: np.ndarray, min_gap: int) -> np.ndarray:
+    """
+    Marks the points to keep in every ship's track: walking back from the ship's newest point,
+    a point is kept when it is at least min_gap older than the last kept one.
+    The walk starts at the newest point, so the points kept within any tail window ending there
+    are exactly what decimating just that window would keep. Ships are split across cores; this
+    runs once at load, on the main thread (see haversine for why that matters).
+    """
+    keep = np.zeros(len(ts), dtype=np.bool_)
+    for ship in prange(len(offsets) - 1):
+        newest = offsets[ship + 1] - 1
+        keep[newest] = True
+        last_kept = ts[newest]
+        for i in range(newest - 1, offsets[ship] - 1, -1):
+            if last_kept - ts[i] >= min_gap:
+                keep[i] = True
+                last_kept = ts[i]
+    return keep
+
+def read_ais_csv(file_path: str) -> pd.DataFrame:
+    """
+    Reads the AIS CSV with the multi-threaded Arrow parser, converting the essential columns to
+    CSV_COLUMN_TYPES in the same pass. Falls back to pandas' coercing path if a value does not parse.
+    """
+    try:
+        # --- OPTIMIZATION: Typed parse with Arrow, so the cleaning conversions below are no-ops ---
+        convert_options = pacsv.ConvertOptions(column_types=CSV_COLUMN_TYPES, strings_can_be_null=True)
+        return pacsv.read_csv(file_path, convert_options=convert_options).to_pandas()
+        # --- End Optimization ---
+    except pa.ArrowInvalid as e:
+        print(f"LOAD WARNING: Typed CSV parse failed ({e}); re-reading with type coercion.")
+        return pd.read_csv(file_path, engine='pyarrow', dtype={MMSI_COL: str})
+
+def prepare_from_csv(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Loads, cleans and sorts AIS data from CSV into the decimated track arrays.
+    Returns the latest record per MMSI (row i is ship i), with metadata converted.
+    """
+    # Make sure we modify the global variables
+    global ais_t0_ns, tail_ts_s, tail_lat, tail_lon, tail_offsets
+    load_start = time.time()
+
+    df = read_ais_csv(file_path)
+    print(f"LOAD: Successfully loaded {len(df)} records. (Took {time.time() - load_start:.2f}s)")
+    prep_start = time.time()
+
+    # --- Data Cleaning and Type Conversion ---
+    print("LOAD: Starting data cleaning and type conversion...")
+    essential_cols = [MMSI_COL, TIME_COL, LAT_COL, LON_COL]
+    missing_cols = [col for col in essential_cols if col not in df.columns]
+    if missing_cols:
+        print(f"LOAD ERROR: Missing essential columns in CSV: {missing_cols}")
+        return None
+
+    # Convert Time Column (nanosecond resolution, so int64 views are ns since epoch)
+    df[TIME_COL] = pd.to_datetime(df[TIME_COL], errors='coerce').astype('datetime64[ns]')
+    initial_rows = len(df)
+    df.dropna(subset=[TIME_COL], inplace=True)
+    if len(df) < initial_rows:
+         print(f"LOAD: Dropped {initial_rows - len(df)} rows due to invalid '{TIME_COL}' values.")
+
+    # Convert Lat/Lon Columns
+    df[LAT_COL] = pd.to_numeric(df[LAT_COL], errors='coerce')
+    df[LON_COL] = pd.to_numeric(df[LON_COL], errors='coerce')
+    initial_rows = len(df)
+    df.dropna(subset=[LAT_COL, LON_COL], inplace=True)
+    if len(df) < initial_rows:
+         print(f"LOAD: Dropped {initial_rows - len(df)} rows due to invalid LAT/LON values.")
+
+    # Convert MMSI to string
+    df[MMSI_COL] = df[MMSI_COL].astype(str)
+
+    if df.empty:
+        print("LOAD ERROR: No valid records remaining after cleaning.")
+        return None
+    print(f"LOAD: Cleaning and type conversion finished. (Took {time.time() - prep_start:.2f}s)")
+
+    # --- Sort Data ---
+    sort_start = time.time()
+    print(f"LOAD: Sorting data by '{MMSI_COL}' and '{TIME_COL}'...")
+    # --- OPTIMIZATION: Sort only the columns the hot path needs; the index keeps the original
+    # row labels, so the metadata of the few rows that need it is looked up in df afterwards ---
+    hot_df = df[essential_cols].sort_values(by=[MMSI_COL, TIME_COL], ascending=True)
+    # --- End Optimization ---
+    print(f"LOAD: Sorting complete. (Took {time.time() - sort_start:.2f}s)")
+
+    # --- OPTIMIZATION: Flatten positions into contiguous arrays with per-MMSI offsets ---
+    group_start = time.time()
+    print(f"LOAD: Building position arrays and offsets by {MMSI_COL}...")
+    # --- OPTIMIZATION: Compact dtypes, 16 bytes per record instead of 24. AIS timestamps have
+    # whole-second resolution and span far less than int32's ~68 years. Latitudes fit float32 to
+    # within half a unit of the 5th decimal; longitudes beyond ~128 degrees do not, so they stay float64 ---
+    ts_ns = hot_df[TIME_COL].values.view('i8')
+    ais_t0_ns = int(ts_ns.min())
+    ts_s = ((ts_ns - ais_t0_ns) // 1_000_000_000).astype(np.int32)
+    # MMSIs are sorted, so np.unique's first-occurrence indices are the block starts
+    mmsis, starts = np.unique(hot_df[MMSI_COL].to_numpy(), return_index=True)
+    mmsi_offsets = np.append(starts, len(hot_df)).astype(np.int64)
+    lats = hot_df[LAT_COL].to_numpy(dtype=np.float32)
+    lons = hot_df[LON_COL].to_numpy(dtype=np.float64)
+    latest_rows = mmsi_offsets[1:] - 1 # Last row of each sorted MMSI block
+
+    print(f"LOAD: Position arrays complete. Indexed {len(mmsis)} ships. (Took {time.time() - group_start:.2f}s)")
+    # --- End Optimization ---
+
+    # --- OPTIMIZATION: Decimate every track once, so requests only slice a tail window ---
+    decimate_start = time.time()
+    keep = _decimate_tracks(ts_s, mmsi_offsets, MIN_TAIL_GAP_S)
+    tail_ts_s = ts_s[keep]
+    tail_lat = lats[keep]
+    tail_lon = lons[keep]
+    tail_offsets = np.concatenate(([0], np.cumsum(np.add.reduceat(keep, mmsi_offsets[:-1], dtype=np.int64))))
+    print(f"LOAD: Decimated {len(keep)} records to {len(tail_ts_s)} tail points. (Took {time.time() - decimate_start:.2f}s)")
+    # --- End Optimization ---
+
+    # Row i is ship i in the track arrays
+    latest_records_df = df.loc[hot_df.index[latest_rows]].reset_index(drop=True)
+
+    # --- Metadata Type Conversion (latest records only, the rows responses are built from) ---
+    # Convert known numeric columns to numeric, coercing errors.
+    numeric_cols = ["SOG", "COG", "Heading", "Length", "Width", "Draft", "VesselType", "Status"]
+    for col in numeric_cols:
+         if col in latest_records_df.columns:
+             latest_records_df[col] = pd.to_numeric(latest_records_df[col], errors='coerce')
+
+    # Convert known string columns to string type in DataFrame.
+    string_cols = ["IMO", "CallSign", "VesselName", "TransceiverClass", "Cargo"]
+    for col in string_cols:
+        if col in latest_records_df.columns:
+            latest_records_df[col] = latest_records_df[col].fillna('').astype(str).replace('', np.nan)
+
+    return latest_records_df
+
+def prepared_cache_dir(file_path: str) -> str:
+    """Directory holding the prepared data for a CSV file, next to the file."""
+    return file_path + PREPARED_CACHE_SUFFIX
+
+def save_prepared_data(file_path: str, latest_records_df: pd.DataFrame) -> None:
+    """
+    Writes the decimated track arrays (.npy, memory-mappable) and the latest records (Parquet)
+    so the next startup can skip the CSV. The metadata file is written last and marks the set complete.
+    """
+    cache_dir = prepared_cache_dir(file_path)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name, array in (("tail_ts_s", tail_ts_s), ("tail_lat", tail_lat), ("tail_lon", tail_lon), ("tail_offsets", tail_offsets)):
+            np.save(os.path.join(cache_dir, f"{name}.npy"), array)
+        latest_records_df.to_parquet(os.path.join(cache_dir, "latest_records.parquet"), engine='pyarrow', compression='zstd')
+        with open(meta_path, "w") as f:
+            json.dump({"version": PREPARED_CACHE_VERSION, "min_tail_gap_s": MIN_TAIL_GAP_S, "ais_t0_ns": ais_t0_ns}, f)
+        print(f"LOAD: Saved prepared data to {cache_dir}")
+    except OSError as e:
+        print(f"LOAD WARNING: Could not save prepared data to {cache_dir}: {e}")
+
+def load_prepared_data(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Loads prepared data saved by save_prepared_data, memory-mapping the track arrays.
+    Returns the latest records, or None if there is no complete cache newer than the CSV.
+    """
+    global ais_t0_ns, tail_ts_s, tail_lat, tail_lon, tail_offsets
+    cache_dir = prepared_cache_dir(file_path)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_path) or os.path.getmtime(meta_path) < os.path.getmtime(file_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("version") != PREPARED_CACHE_VERSION or meta.get("min_tail_gap_s") != MIN_TAIL_GAP_S:
+        return None
+
+    load_start = time.time()
+    ais_t0_ns = meta["ais_t0_ns"]
+    tail_ts_s, tail_lat, tail_lon, tail_offsets = (
+        np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode='r')
+        for name in ("tail_ts_s", "tail_lat", "tail_lon", "tail_offsets")
+    )
+    latest_records_df = pd.read_parquet(os.path.join(cache_dir, "latest_records.parquet"), engine='pyarrow')
+    print(f"LOAD: Loaded prepared data from {cache_dir}: {len(tail_ts_s)} tail points, {len(latest_records_df)} ships. (Took {time.time() - load_start:.2f}s)")
+    return latest_records_df
+
 def load_and_prepare_ais_data(file_path: str) -> Optional[pd.DataFrame]:
-    """Loads, cleans, sorts, pre-groups, and prepares AIS data."""
+    """
+    Loads AIS data into the track arrays and spatial index, from the prepared-data cache when it
+    is newer than the CSV. Returns the latest record per MMSI, the only full-width DataFrame kept.
+    """
     # Make sure we modify the global variables
-    global max_historical_time, time_offset, ais_data_grouped_by_mmsi
+    global max_historical_time, time_offset, time_offset_ns, tail_ts_s, tail_lat, tail_lon, tail_offsets, mmsi_to_idx, latest_ship_json, latest_ts_ns, latest_ts_sorted_ns, latest_lat, latest_lon, latest_cos_lat, latest_positions_tree, latest_positions_grid
     print(f"LOAD: Attempting to load AIS data from: {file_path}")
     load_start = time.time()
     if not os.path.exists(file_path):
@@ -141,93 +448,55 @@ def load_and_prepare_ais_data(file_path: str) -> Optional[pd.DataFrame]:
         return None
 
     try:
-        # Read CSV
-        df = pd.read_csv(file_path, low_memory=False)
-        print(f"LOAD: Successfully loaded {len(df)} records. (Took {time.time() - load_start:.2f}s)")
-        prep_start = time.time()
-
-        # --- Data Cleaning and Type Conversion ---
-        print("LOAD: Starting data cleaning and type conversion...")
-        essential_cols = [MMSI_COL, TIME_COL, LAT_COL, LON_COL]
-        missing_cols = [col for col in essential_cols if col not in df.columns]
-        if missing_cols:
-            print(f"LOAD ERROR: Missing essential columns in CSV: {missing_cols}")
-            return None
-
-        # Convert Time Column
-        df[TIME_COL] = pd.to_datetime(df[TIME_COL], errors='coerce')
-        initial_rows = len(df)
-        df.dropna(subset=[TIME_COL], inplace=True)
-        if len(df) < initial_rows:
-             print(f"LOAD: Dropped {initial_rows - len(df)} rows due to invalid '{TIME_COL}' values.")
-
-        # Convert Lat/Lon Columns
-        df[LAT_COL] = pd.to_numeric(df[LAT_COL], errors='coerce')
-        df[LON_COL] = pd.to_numeric(df[LON_COL], errors='coerce')
-        initial_rows = len(df)
-        df.dropna(subset=[LAT_COL, LON_COL], inplace=True)
-        if len(df) < initial_rows:
-             print(f"LOAD: Dropped {initial_rows - len(df)} rows due to invalid LAT/LON values.")
-
-        # Convert MMSI to string
-        df[MMSI_COL] = df[MMSI_COL].astype(str)
-
-        # Convert known numeric columns to numeric, coercing errors.
-        numeric_cols = ["SOG", "COG", "Heading", "Length", "Width", "Draft", "VesselType", "Status"]
-        for col in numeric_cols:
-             if col in df.columns:
-                 df[col] = pd.to_numeric(df[col], errors='coerce')
-
-        # Convert known string columns to string type in DataFrame.
-        string_cols = ["IMO", "CallSign", "VesselName", "TransceiverClass", "Cargo"]
-        for col in string_cols:
-            if col in df.columns:
-                df[col] = df[col].fillna('').astype(str).replace('', np.nan)
-
-        if df.empty:
-            print("LOAD ERROR: No valid records remaining after cleaning.")
-            return None
-        print(f"LOAD: Cleaning and type conversion finished. (Took {time.time() - prep_start:.2f}s)")
-
-        # --- Sort Data ---
-        sort_start = time.time()
-        print(f"LOAD: Sorting data by '{MMSI_COL}' and '{TIME_COL}'...")
-        df.sort_values(by=[MMSI_COL, TIME_COL], inplace=True, ascending=True)
-        # No need to reset index here if we group right after
-        print(f"LOAD: Sorting complete. (Took {time.time() - sort_start:.2f}s)")
-
-        # --- OPTIMIZATION: Pre-group data by MMSI ---
-        group_start = time.time()
-        print(f"LOAD: Pre-grouping data by {MMSI_COL}...")
-        # Use a dictionary comprehension for potentially better performance
-        ais_data_grouped_by_mmsi = {
-            mmsi: group_df.reset_index(drop=True) # Reset index within each group
-            for mmsi, group_df in df.groupby(MMSI_COL, sort=False) # sort=False since df is already sorted
-        }
-        num_groups = len(ais_data_grouped_by_mmsi)
-        print(f"LOAD: Pre-grouping complete. Created {num_groups} groups. (Took {time.time() - group_start:.2f}s)")
+        # --- OPTIMIZATION: Reuse the prepared data from a previous startup ---
+        latest_records_df = load_prepared_data(file_path)
+        if latest_records_df is None:
+            latest_records_df = prepare_from_csv(file_path)
+            if latest_records_df is None:
+                return None
+            save_prepared_data(file_path, latest_records_df)
+        # --- End Optimization ---
+
+        # --- OPTIMIZATION: Index the latest position of each ship ---
+        index_start = time.time()
+        print("LOAD: Building spatial index over the latest position per MMSI...")
+        mmsi_to_idx = {mmsi: i for i, mmsi in enumerate(latest_records_df[MMSI_COL].tolist())}
+        # --- OPTIMIZATION: Convert and JSON-encode the static response fields once, so requests index a
+        # list instead of slicing the DataFrame; the closing brace is dropped so per-request fields can follow ---
+        latest_ship_json = [orjson.dumps(fields)[:-1] for fields in ship_fields_from_records(latest_records_df)]
+        # --- End Optimization ---
+        latest_ts_ns = latest_records_df[TIME_COL].values.view('i8')
+        # Distances use the full-precision positions
+        latest_lat = latest_records_df[LAT_COL].to_numpy(dtype=np.float64)
+        latest_lon = latest_records_df[LON_COL].to_numpy(dtype=np.float64)
+        latest_cos_lat = np.cos(np.radians(latest_lat))
+        latest_ts_sorted_ns = np.sort(latest_ts_ns)
+        latest_positions_tree = cKDTree(to_unit_vectors(latest_lat, latest_lon))
+        latest_positions_grid = build_grid(latest_lat, latest_lon)
+        print(f"LOAD: Spatial index built over {len(latest_records_df)} ships. (Took {time.time() - index_start:.2f}s)")
         # --- End Optimization ---
 
         # --- Calculate Time Offset ---
         offset_start = time.time()
-        # Calculate max time from the original df before it's potentially modified/discarded
-        max_historical_time = df[TIME_COL].max()
+        # Each ship's latest record is its newest, so the newest of those is the dataset's newest
+        max_historical_time = latest_records_df[TIME_COL].max()
         if pd.isna(max_historical_time):
              print("LOAD ERROR: Could not determine maximum historical timestamp after cleaning.")
-             # Clean up potentially large intermediate df before returning None
-             del df
-             ais_data_grouped_by_mmsi = {}
+             tail_ts_s, tail_lat, tail_lon, tail_offsets, mmsi_to_idx, latest_ship_json = None, None, None, None, {}, []
+             latest_ts_ns, latest_ts_sorted_ns, latest_lat, latest_lon, latest_cos_lat, latest_positions_tree = None, None, None, None, None, None
+             latest_positions_grid = {}
              return None
 
         current_utc_time = pd.Timestamp.utcnow().tz_localize(None)
         time_offset = current_utc_time - max_historical_time
+        time_offset_ns = int(time_offset.value)
         print(f"LOAD: Max historical timestamp: {max_historical_time}")
         print(f"LOAD: Current UTC time: {current_utc_time}")
         print(f"LOAD: Calculated time offset: {time_offset}. (Took {time.time() - offset_start:.2f}s)")
 
         print(f"LOAD: Data loading and preparation complete. Total time: {time.time() - load_start:.2f}s")
-        # Return the main DataFrame as it's still needed for initial filtering
-        return df
+        # Only the latest records are needed for the response metadata
+        return latest_records_df
 
     except FileNotFoundError:
         print(f"LOAD ERROR: File not found at {file_path}")
@@ -242,11 +511,120 @@ def load_and_prepare_ais_data(file_path: str) -> Optional[pd.DataFrame]:
         return None
 
 
+def build_ship(ship_idx: int, distance: float, tail_duration_s: int) -> Tuple[bytes, float]:
+    """
+    Builds the response of the ship at ship_idx, with its tail, as a JSON object in the ShipData
+    shape. Returns it with the time taken.
+    """
+    ship_start_time = time.time()
+    latest_original_ns = int(latest_ts_ns[ship_idx])
+
+    # --- Calculate Tail from the ship's slice of the position arrays ---
+    # The ship's track is already decimated and ends at its latest record
+    start, end = tail_offsets[ship_idx], tail_offsets[ship_idx + 1]
+    latest_s = (latest_original_ns - ais_t0_ns) // 1_000_000_000
+    # --- OPTIMIZATION: Binary search the tail window start in the sorted timestamps ---
+    lo = start + np.searchsorted(tail_ts_s[start:end], latest_s - tail_duration_s, side='left')
+    # --- End Optimization ---
+
+    tail_lats = tail_lat[lo:end].astype(np.float64).round(COORD_DECIMALS).tolist()
+    tail_lons = tail_lon[lo:end].tolist()
+    # --- OPTIMIZATION: Convert the simulated timestamps to datetimes in one vectorized pass ---
+    tail_ns = ais_t0_ns + time_offset_ns + tail_ts_s[lo:end].astype(np.int64) * 1_000_000_000
+    tail_times = tail_ns.astype('datetime64[ns]').astype('datetime64[us]').tolist()
+    # --- End Optimization ---
+
+    # --- OPTIMIZATION: Only the per-request fields are encoded; the static ones were encoded at load ---
+    dynamic_fields = orjson.dumps({
+        "latest_timestamp": np.datetime64(latest_original_ns + time_offset_ns, 'ns').astype('datetime64[us]').tolist(),
+        "distance_km": distance,
+        "tail": [
+            {"lat": point_lat, "lon": point_lon, "timestamp": point_time}
+            for point_lat, point_lon, point_time in zip(tail_lats, tail_lons, tail_times)
+        ],
+    })
+    ship = latest_ship_json[ship_idx] + b"," + dynamic_fields[1:]
+    # --- End Optimization ---
+    return ship, time.time() - ship_start_time
+
+def build_ships(ship_args: List[tuple]) -> Tuple[bytes, List[float]]:
+    """
+    Runs build_ship over a chunk of ships in one worker task and serializes the chunk as
+    comma-separated JSON objects. Returns the bytes with the time taken per ship.
+    """
+    built = [build_ship(*args) for args in ship_args]
+    body = b",".join(ship for ship, _ in built)
+    return body, [ship_process_time for _, ship_process_time in built]
+
+
+def init_ship_build_worker(file_path: str, offset_ns: int) -> None:
+    """
+    Initializer of the ship-build worker processes: memory-maps the prepared data saved at startup
+    and restores the state build_ship reads.
+    """
+    global time_offset_ns, latest_ts_ns, latest_ship_json
+    latest_records_df = load_prepared_data(file_path)
+    if latest_records_df is None:
+        raise RuntimeError(f"No prepared data for {file_path}")
+    time_offset_ns = offset_ns
+    latest_ts_ns = latest_records_df[TIME_COL].values.view('i8')
+    latest_ship_json = [orjson.dumps(fields)[:-1] for fields in ship_fields_from_records(latest_records_df)]
+
+
+def create_ship_build_pool(file_path: str) -> Executor:
+    """
+    Pool that builds response chunks off the event loop. build_ship is GIL-bound Python, so with
+    several cores it is a pool of spawned processes that memory-map the prepared data (sharing its
+    pages) and return encoded bytes. Workers are spawned rather than forked, since forking after
+    Numba's threading layer has started can deadlock. Falls back to threads if the workers cannot load.
+    """
+    if SHIP_BUILD_WORKERS > 1:
+        pool = ProcessPoolExecutor(max_workers=SHIP_BUILD_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=init_ship_build_worker, initargs=(file_path, time_offset_ns))
+        try:
+            # Start the workers now rather than on the first request
+            list(pool.map(int, range(SHIP_BUILD_WORKERS)))
+            return pool
+        except BrokenProcessPool as e:
+            print(f"STARTUP WARNING: Ship-build worker processes failed to start ({e}), using threads.")
+            pool.shutdown()
+    return ThreadPoolExecutor(max_workers=SHIP_BUILD_WORKERS, thread_name_prefix="ship-build")
+
+
+async def build_ship_chunks(ship_args: List[tuple]) -> List[Tuple[bytes, List[float]]]:
+    """
+    Builds the ships in one build_ships chunk per worker of the ship-build pool. If a worker process
+    has died, the broken pool is replaced and the chunks are built once more.
+    """
+    global ship_build_pool
+    chunk_size = -(-len(ship_args) // SHIP_BUILD_WORKERS) # Ceiling division
+    loop = asyncio.get_running_loop()
+
+    def run_chunks(pool: Executor):
+        return asyncio.gather(*(
+            loop.run_in_executor(pool, build_ships, ship_args[k:k + chunk_size])
+            for k in range(0, len(ship_args), chunk_size)
+        ))
+
+    broken_pool = ship_build_pool
+    try:
+        return await run_chunks(broken_pool)
+    except BrokenProcessPool:
+        async with ship_build_pool_lock:
+            # Concurrent requests hit the same broken pool; only the first replaces it
+            if ship_build_pool is broken_pool:
+                print("REQUEST WARNING: A ship-build worker process died, restarting the pool.")
+                broken_pool.shutdown(wait=False, cancel_futures=True)
+                ship_build_pool = await loop.run_in_executor(None, create_ship_build_pool, CSV_FILE_PATH)
+        return await run_chunks(ship_build_pool)
+
+
 # --- FastAPI Application Setup ---
 app = FastAPI(
     title="Ship AIS Data API (v2 - Pre-Grouped)",
     description="Provides simulated real-time ship AIS data with position tails, based on historical data. Optimized with pre-grouping.",
-    version="2.1.0" # Incremented version number for optimization
+    version="2.1.0", # Incremented version number for optimization
+    default_response_class=ORJSONResponse
 )
 
 # --- Load Data on Application Startup ---
@@ -254,23 +632,36 @@ app = FastAPI(
 async def startup_event():
     """Load and prepare the AIS data when the FastAPI application starts."""
     # Make sure we assign to the global df variable
-    global ais_data_df
+    global latest_records_df, ship_build_pool
     print("="*20 + " Application Startup " + "="*20)
     startup_start = time.time()
+    # Compile (or load from cache) the haversine kernel now rather than on the first request
+    haversine(0.0, 0.0, np.zeros(1), np.zeros(1), np.ones(1))
     # Load data and perform pre-grouping
-    ais_data_df = load_and_prepare_ais_data(CSV_FILE_PATH)
-    if ais_data_df is None or not ais_data_grouped_by_mmsi:
+    latest_records_df = load_and_prepare_ais_data(CSV_FILE_PATH)
+    if latest_records_df is None or not mmsi_to_idx:
         print("STARTUP FATAL: Failed to load or pre-group AIS data. API endpoints will likely fail.")
-        # Ensure ais_data_df is None if loading failed
-        ais_data_df = None
+        # Ensure latest_records_df is None if loading failed
+        latest_records_df = None
     else:
-        print(f"STARTUP SUCCESS: AIS data ({len(ais_data_df)} records) loaded and pre-grouped ({len(ais_data_grouped_by_mmsi)} ships). (Took {time.time() - startup_start:.2f}s)")
+        print(f"STARTUP SUCCESS: AIS data ({len(tail_ts_s)} tail points) loaded and pre-grouped ({len(mmsi_to_idx)} ships). (Took {time.time() - startup_start:.2f}s)")
+        ship_build_pool = create_ship_build_pool(CSV_FILE_PATH)
+        print(f"STARTUP: Building responses with {SHIP_BUILD_WORKERS} {type(ship_build_pool).__name__} worker(s).")
     print("="*20 + " Startup Complete " + "="*20)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the response-building workers."""
+    if ship_build_pool is not None:
+        ship_build_pool.shutdown(cancel_futures=True)
+
 
 # --- API Endpoint Definition ---
+# The response body is pre-encoded JSON, so ShipData only documents the schema; declaring it
+# under responses rather than response_model keeps FastAPI from ever validating or re-encoding it
 @app.get("/ships",
-         response_model=List[ShipData],
+         response_class=Response,
+         responses={200: {"model": List[ShipData], "content": {"application/json": {}}}},
          summary="Find ships with tails within a radius",
          description="Returns a list of ships, each with its latest simulated position and a 'tail' of previous positions.")
 async def get_ships_with_tails(
@@ -281,151 +672,80 @@ async def get_ships_with_tails(
     sim_window_minutes: int = Query(60, description="Simulation window size in minutes (how far back from 'now' to look).", gt=0)
 ):
     """API endpoint to retrieve aggregated ship data with position tails."""
-    global ais_data_df, time_offset, ais_data_grouped_by_mmsi # Include grouped data
     request_start_time = time.time()
     print(f"\n--- Request Received: /ships?lat={lat}&lon={lon}&radius={radius}&tail_hours={tail_hours}&sim_window={sim_window_minutes} ---")
 
-    # Check if both main df and grouped data are available
-    if ais_data_df is None or ais_data_df.empty or not ais_data_grouped_by_mmsi or time_offset is None:
+    # Check if the position arrays and the latest-record index are available
+    if latest_records_df is None or latest_records_df.empty or not mmsi_to_idx or latest_positions_tree is None or time_offset_ns is None:
         print("REQUEST ERROR: AIS data not available or not pre-grouped.")
         raise HTTPException(status_code=503, detail="AIS data is not available or not properly loaded/pre-grouped.")
 
     try:
         # --- Time Simulation Filter (on main DataFrame) ---
         step_start_time = time.time()
-        current_utc_time = pd.Timestamp.utcnow().tz_localize(None)
-        simulated_window_end = current_utc_time
-        simulated_window_start = simulated_window_end - pd.Timedelta(minutes=sim_window_minutes)
-        target_start_time = simulated_window_start - time_offset
-        target_end_time = simulated_window_end - time_offset
-        print(f"Step 1: Calculated time window ({target_start_time} to {target_end_time}). (Took {time.time() - step_start_time:.4f}s)")
+        # --- OPTIMIZATION: Compute the window in raw int64 ns, with no per-request Timestamp arithmetic ---
+        target_end_ns = time.time_ns() - time_offset_ns
+        target_start_ns = target_end_ns - sim_window_minutes * 60_000_000_000
+        # --- End Optimization ---
+        print(f"Step 1: Calculated time window ({np.datetime64(target_start_ns, 'ns')} to {np.datetime64(target_end_ns, 'ns')}). (Took {time.time() - step_start_time:.4f}s)")
 
         step_start_time = time.time()
-        # Filter the main DataFrame
-        time_filtered_df = ais_data_df[
-            (ais_data_df[TIME_COL] >= target_start_time) &
-            (ais_data_df[TIME_COL] <= target_end_time)
-        ].copy() # Copy might not be strictly needed if only used for filtering indices
-        print(f"Step 2: Filtered main DF by time window. Found {len(time_filtered_df)} potential records. (Took {time.time() - step_start_time:.4f}s)")
-
-        if time_filtered_df.empty:
-             print("REQUEST INFO: No records found within the time window in main DF.")
+        # Only ships whose latest known position falls inside the window are current
+        # --- OPTIMIZATION: Binary search the window bounds instead of masking every ship ---
+        num_in_window = (np.searchsorted(latest_ts_sorted_ns, target_end_ns, side='right')
+                         - np.searchsorted(latest_ts_sorted_ns, target_start_ns, side='left'))
+        # --- End Optimization ---
+        print(f"Step 2: Counted latest positions in the time window. Found {num_in_window} ships. (Took {time.time() - step_start_time:.4f}s)")
+
+        if num_in_window == 0:
+             print("REQUEST INFO: No ships with a latest position within the time window.")
              raise HTTPException(status_code=404, detail=f"No ship data found within the simulated time window ({sim_window_minutes} mins).")
 
-        # --- Geographic Filter (on time-filtered DataFrame) ---
+        # --- Geographic Filter (spatial index over latest positions) ---
         step_start_time = time.time()
-        distances = haversine(lat, lon, time_filtered_df[LAT_COL], time_filtered_df[LON_COL])
-        print(f"Step 3: Calculated distances for {len(time_filtered_df)} records. (Took {time.time() - step_start_time:.4f}s)")
+        # --- OPTIMIZATION: Small searches read a few grid buckets; larger ones traverse the KD-tree ---
+        candidates = grid_candidates(latest_positions_grid, lat, lon, radius)
+        if candidates is None:
+            candidates = np.array(latest_positions_tree.query_ball_point(to_unit_vectors(lat, lon)[0], chord_length(radius)), dtype=np.intp)
+        # --- End Optimization ---
+        candidates_ts_ns = latest_ts_ns[candidates]
+        candidates = np.sort(candidates[(candidates_ts_ns >= target_start_ns) & (candidates_ts_ns <= target_end_ns)])
+        distances = cheap_distance_km(lat, lon, latest_lat[candidates], latest_lon[candidates], radius, latest_cos_lat[candidates])
+        print(f"Step 3: Queried spatial index. Found {len(candidates)} candidate ships. (Took {time.time() - step_start_time:.4f}s)")
 
         step_start_time = time.time()
         within_radius_idx = distances <= radius
-        # Get the DataFrame of records within the radius and time window
-        geo_time_filtered_df = time_filtered_df[within_radius_idx].copy() # Copy needed before adding column
-        geo_time_filtered_df['distance_km'] = distances[within_radius_idx]
-        print(f"Step 4: Filtered by radius ({radius}km). Found {len(geo_time_filtered_df)} records in area/time. (Took {time.time() - step_start_time:.4f}s)")
-
-
-        if geo_time_filtered_df.empty:
-            print("REQUEST INFO: No records found within the radius after time filtering.")
+        ships_in_area = candidates[within_radius_idx]
+        # Distances stay in an aligned array rather than being added to a frame as a column
+        distances_in_radius = distances[within_radius_idx]
+        num_unique_ships = len(ships_in_area)
+        print(f"Step 4: Filtered by radius ({radius}km). Found {num_unique_ships} ships in area/time. (Took {time.time() - step_start_time:.4f}s)")
+
+        if num_unique_ships == 0:
+            print("REQUEST INFO: No ships found within the radius and time window.")
             raise HTTPException(status_code=404, detail="No ships found within the specified radius and time window.")
 
-        # --- Aggregation: Find Latest Record per Ship (from geo/time filtered data) ---
-        step_start_time = time.time()
-        # Group the filtered data and find the index of the latest time for each MMSI
-        latest_indices = geo_time_filtered_df.groupby(MMSI_COL)[TIME_COL].idxmax()
-        # Select the full rows for these latest records
-        latest_records_df = geo_time_filtered_df.loc[latest_indices]
-        num_unique_ships = len(latest_records_df)
-        print(f"Step 5: Found latest records for {num_unique_ships} unique ships in area/time. (Took {time.time() - step_start_time:.4f}s)")
-
-
         # --- Prepare Response ---
         step_start_time = time.time()
-        print(f"Step 6: Preparing response and calculating tails for {num_unique_ships} ships using pre-grouped data...")
-        result_ships: List[ShipData] = []
-        tail_duration = pd.Timedelta(hours=tail_hours)
-        min_time_diff = timedelta(minutes=1) # Minimum time difference for tail points
-        ship_process_times = []
-
-        for i, (index, latest_record) in enumerate(latest_records_df.iterrows()):
-            ship_start_time = time.time()
-            mmsi = latest_record[MMSI_COL]
-            latest_original_time = latest_record[TIME_COL]
-            latest_simulated_time = latest_original_time + time_offset
-            distance = latest_record['distance_km']
-
-            # --- Calculate Tail using Pre-Grouped Data ---
-            tail_positions: List[Position] = []
-            # --- OPTIMIZATION: Get the pre-grouped DataFrame for this MMSI ---
-            ship_df = ais_data_grouped_by_mmsi.get(mmsi)
-            # --- End Optimization ---
-
-            if ship_df is not None and not ship_df.empty:
-                tail_start_original_time = latest_original_time - tail_duration
-                # --- OPTIMIZATION: Filter the smaller ship_df ---
-                tail_candidates_df = ship_df[
-                    (ship_df[TIME_COL] >= tail_start_original_time) &
-                    (ship_df[TIME_COL] <= latest_original_time)
-                ]
-                # --- End Optimization ---
-
-                # --- Select points at least 1 minute apart (from candidates) ---
-                selected_tail_rows = []
-                last_added_original_time = None
-
-                if not tail_candidates_df.empty:
-                    # Iterate backwards through the candidates (from newest to oldest)
-                    for idx in range(len(tail_candidates_df) - 1, -1, -1):
-                        current_row = tail_candidates_df.iloc[idx]
-                        current_original_time = current_row[TIME_COL]
-
-                        if last_added_original_time is None:
-                            selected_tail_rows.append(current_row)
-                            last_added_original_time = current_original_time
-                        elif (last_added_original_time - current_original_time) >= min_time_diff:
-                            selected_tail_rows.append(current_row)
-                            last_added_original_time = current_original_time
-
-                    selected_tail_rows.reverse() # Restore chronological order
-
-                # Iterate over the selected tail rows to create Position objects
-                for _, tail_row in pd.DataFrame(selected_tail_rows).iterrows():
-                     simulated_tail_time = tail_row[TIME_COL] + time_offset
-                     tail_positions.append(
-                         Position(
-                             lat=tail_row[LAT_COL],
-                             lon=tail_row[LON_COL],
-                             timestamp=simulated_tail_time
-                         )
-                     )
-            else:
-                print(f"  - Warning: No pre-grouped data found for MMSI {mmsi}. Tail will be empty.")
-
-
-            # --- Construct ShipData Object ---
-            ship_object = ShipData.from_record(
-                record=latest_record,
-                tail_positions=tail_positions,
-                dist=distance,
-                simulated_time=latest_simulated_time
-            )
-            result_ships.append(ship_object)
-            ship_process_time = time.time() - ship_start_time
-            ship_process_times.append(ship_process_time)
-
+        print(f"Step 5: Preparing response and calculating tails for {num_unique_ships} ships using pre-grouped data...")
+        tail_duration_s = int(tail_hours * 3600)
+
+        # --- OPTIMIZATION: Build ships in one chunk per worker, off the event loop ---
+        # Ships are addressed by index into the per-ship arrays, with no DataFrame access per request
+        ship_args = list(zip(ships_in_area.tolist(), distances_in_radius.tolist(), itertools.repeat(tail_duration_s)))
+        # Every chunk is built before responding, so a failure is reported as a 500, never a truncated body
+        built_chunks = await build_ship_chunks(ship_args)
+        # --- End Optimization ---
 
+        ship_process_times = [t for _, chunk_times in built_chunks for t in chunk_times]
         avg_ship_time = np.mean(ship_process_times) if ship_process_times else 0
         max_ship_time = np.max(ship_process_times) if ship_process_times else 0
-        print(f"Step 7: Finished processing tails (min 1 min interval using pre-grouped data). Avg time/ship: {avg_ship_time:.4f}s, Max time/ship: {max_ship_time:.4f}s. (Total Step 6/7 Took {time.time() - step_start_time:.4f}s)")
-
-
-        if not result_ships:
-             print("REQUEST INFO: No ships found after final processing.")
-             raise HTTPException(status_code=404, detail="No ships found after processing.")
+        print(f"Step 6: Finished processing tails (min 1 min interval using pre-grouped data). Avg time/ship: {avg_ship_time:.4f}s, Max time/ship: {max_ship_time:.4f}s. (Total Step 5/6 Took {time.time() - step_start_time:.4f}s)")
 
         total_request_time = time.time() - request_start_time
-        print(f"--- Request Completed: Found {len(result_ships)} ships. Total time: {total_request_time:.4f}s ---")
-        return result_ships
+        print(f"--- Request Completed: Found {len(ship_process_times)} ships. Total time: {total_request_time:.4f}s ---")
+        # The chunks are already encoded JSON objects; joining them is the only serialization step
+        return Response(b"[" + b",".join(body for body, _ in built_chunks) + b"]", media_type="application/json")
 
     except HTTPException as e:
          total_request_time = time.time() - request_start_time
@@ -448,4 +768,10 @@ if __name__ == "__main__":
          print("Ensure the file exists and the path is correct in the script.")
          print("-" * 50)
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if DEV_MODE:
+        # Restart on changes to main.py
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # A single server process: the ship-build pool already spreads response building over the
+        # cores, and every extra server process would load its own copy of the data
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools", log_level="warning")
@@ -15,8 +15,14 @@ let
   pythonPackages = pythonVersion.withPackages (ps: [
     ps.pandas       # For data manipulation (reading CSV, DataFrame operations)
     ps.numpy        # For numerical operations (Haversine calculation)
+    ps.numba        # JIT-compiled kernels (track decimation, haversine)
+    ps.scipy        # KD-tree spatial index for radius queries
     ps.fastapi      # The web framework used for the API
     ps.uvicorn      # ASGI server to run FastAPI (with standard features)
+    ps.uvloop       # Faster event loop for the production server
+    ps.httptools    # Faster HTTP parser for the production server
+    ps.orjson       # Fast JSON serialization for API responses
+    ps.pyarrow      # Multi-threaded CSV parsing
     # Add any other Python dependencies here if needed
   ]);
 
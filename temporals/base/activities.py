@@ -1,5 +1,5 @@
 from temporalio import activity
-import random
+import functools
 import logging
 import os
 import json
@@ -11,6 +11,20 @@ from shared import ReportDetails, EnrichedReportDetails
 
 logging.info("activities.py loaded: registering activities...")
 
+AIS_API_URL = "http://0.0.0.0:8000/ships"
+AIS_REQUEST_TIMEOUT = 15 # seconds
+AIS_MAX_KEEPALIVE_CONNECTIONS = 50
+
+@functools.lru_cache(maxsize=1)
+def _ais_client():
+    """
+    Return the shared AIS API client, building it on first use. httpx is imported here rather
+    than at module level to keep it out of the workflow sandbox.
+    """
+    import httpx
+    return httpx.AsyncClient(timeout=AIS_REQUEST_TIMEOUT,
+                             limits=httpx.Limits(max_keepalive_connections=AIS_MAX_KEEPALIVE_CONNECTIONS))
+
 @activity.defn
 async def calculate_trust_score(source_account_id: str, ip: str = None, user_agent: str = None, is_logged_in: bool = False) -> float:
     try:
@@ -74,16 +88,14 @@ async def calculate_visibility(report: EnrichedReportDetails) -> int:
 @activity.defn
 async def find_ais_neighbours(report: EnrichedReportDetails) -> list[str]:
     try:
-        import requests
+        import httpx
         logging.info(f"Fetching AIS data for ships around coordinates: {report.latitude}, {report.longitude}")
-        url = f"http://0.0.0.0:8000/ships?lat={report.latitude}&lon={report.longitude}&radius={report.visibility}&tail_hours=0.1&sim_window_minutes=120"
-        logging.info(f"Making GET request to {url}")
+        params = {"lat": report.latitude, "lon": report.longitude, "radius": report.visibility,
+                  "tail_hours": 0.1, "sim_window_minutes": 120}
+        logging.info(f"Making GET request to {AIS_API_URL} with {params}")
         try:
-            response = requests.request(
-                method="GET",
-                url=url,
-                timeout=15 # Example timeout for the request itself
-            )
+            # Shared keep-alive client, so calls reuse connections and don't block the event loop
+            response = await _ais_client().get(AIS_API_URL, params=params)
             # Raise an exception for bad status codes (4xx or 5xx)
             response.raise_for_status()
 
@@ -97,7 +109,7 @@ async def find_ais_neighbours(report: EnrichedReportDetails) -> list[str]:
             logging.info(f"Found ships around location at this time: {neighbours}")
             return neighbours
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             activity.logger.error(f"HTTP request failed: {e}")
             # Re-raise the exception so Temporal knows the activity failed
             raise e
@@ -227,6 +239,23 @@ async def llm_enrich(report: EnrichedReportDetails) -> str:
         logging.error(f"Exception in llm_enrich: {e}")
         raise
 
+# Prometheus metric line templates, parsed once at import rather than per call
+_SHIP_INFO_TEMPLATE = 'ship_info{{{labels},stage="initial",timestamp="{timestamp}"}} 1'
+_TRUST_SCORE_TEMPLATE = ('ship_trust_score{{{labels},report_number="{report_number}",stage="final",enriched="true",'
+                         'timestamp="{timestamp}"}} {trust_score}')
+_REPORT_NUMBER_TOTAL_TEMPLATE = 'ship_report_number_total{{{labels},stage="final",enriched="true",timestamp="{timestamp}"}} 1'
+_DESCRIPTION_LENGTH_TEMPLATE = 'ship_description_length{{{labels},stage="final",enriched="true",timestamp="{timestamp}"}} {length}'
+_LLM_ENRICHMENT_TEMPLATE = ('ship_llm_enrichment{{{labels},report_number="{report_number}",stage="final",enriched="true",'
+                            'description="{description}",timestamp="{timestamp}"}} 1')
+
+@functools.lru_cache(maxsize=10_000, typed=True)
+def _location_labels(source_account_id, latitude, longitude) -> str:
+    """
+    Label prefix shared by every metric line of a report. Memoized, since a report's initial and
+    final metrics (and replays) repeat it; typed so that e.g. 1 and 1.0 render separately.
+    """
+    return f'source_account_id="{source_account_id}",latitude="{latitude}",longitude="{longitude}"'
+
 @activity.defn
 async def convert_to_prometheus_metrics(report_data) -> str:
     try:
@@ -268,47 +297,24 @@ async def _convert_to_prometheus_metrics(report_data) -> str:
         else:
             timestamp = int(datetime.now().timestamp() * 1000)
     
-    # Determine if this is initial or final metrics
-    is_final = report_number is not None and trust_score is not None
-    stage = "final" if is_final else "initial"
-    
-    # Build metrics with stage label
-    metrics = []
+    labels = _location_labels(source_account_id, latitude, longitude)
     
+    # Determine if this is initial or final metrics
     # For initial metrics, we only have basic ship info
-    if not is_final:
-        metrics.append(
-            f'ship_info{{source_account_id="{source_account_id}",'
-            f'latitude="{latitude}",longitude="{longitude}",'
-            f'stage="{stage}",timestamp="{timestamp}"}} 1'
-        )
+    if report_number is None or trust_score is None:
+        metrics = [_SHIP_INFO_TEMPLATE.format(labels=labels, timestamp=timestamp)]
     else:
         # For final metrics, we have all enriched data
-        metrics.extend([
-            f'ship_trust_score{{source_account_id="{source_account_id}",'
-            f'latitude="{latitude}",longitude="{longitude}",'
-            f'report_number="{report_number}",stage="{stage}",enriched="true",'
-            f'timestamp="{timestamp}"}} {trust_score}',
-            f'ship_report_number_total{{source_account_id="{source_account_id}",'
-            f'latitude="{latitude}",longitude="{longitude}",'
-            f'stage="{stage}",enriched="true",timestamp="{timestamp}"}} 1'
-        ])
+        metrics = [
+            _TRUST_SCORE_TEMPLATE.format(labels=labels, report_number=report_number, timestamp=timestamp, trust_score=trust_score),
+            _REPORT_NUMBER_TOTAL_TEMPLATE.format(labels=labels, timestamp=timestamp),
+        ]
         if enriched_description:
-            metrics.append(
-                f'ship_description_length{{source_account_id="{source_account_id}",'
-                f'latitude="{latitude}",longitude="{longitude}",'
-                f'stage="{stage}",enriched="true",timestamp="{timestamp}"}} {len(enriched_description)}'
-            )
-            # Add a new metric for the LLM enrichment result
-            # We'll use a gauge type metric with a fixed value of 1 to indicate presence
-            # and include the enriched description as a label
+            metrics.append(_DESCRIPTION_LENGTH_TEMPLATE.format(labels=labels, timestamp=timestamp, length=len(enriched_description)))
+            # Gauge with a fixed value of 1 that carries the LLM enrichment result as a label
             escaped_description = enriched_description.replace('"', '\\"')
-            metrics.append(
-                f'ship_llm_enrichment{{source_account_id="{source_account_id}",'
-                f'latitude="{latitude}",longitude="{longitude}",'
-                f'report_number="{report_number}",stage="{stage}",enriched="true",'
-                f'description="{escaped_description}",timestamp="{timestamp}"}} 1'
-            )
+            metrics.append(_LLM_ENRICHMENT_TEMPLATE.format(labels=labels, report_number=report_number,
+                                                           description=escaped_description, timestamp=timestamp))
     
     result = '\n'.join(metrics)
     logging.info(f"Generated Prometheus metrics: {result}")
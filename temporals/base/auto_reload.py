@@ -5,8 +5,9 @@ import sys
 import time
 import signal
 import subprocess
+import threading
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import PatternMatchingEventHandler
 import logging
 
 # Configure logging
@@ -16,29 +17,38 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-class PythonFileHandler(FileSystemEventHandler):
+# Only Python sources trigger a restart; VCS metadata, bytecode and the venv never do
+WATCH_PATTERNS = ['*.py']
+IGNORE_PATTERNS = ['*/.git/*', '*/__pycache__/*', '*/.venv/*', '*.pyc']
+
+class PythonFileHandler(PatternMatchingEventHandler):
     def __init__(self, server_process, worker_process):
+        super().__init__(patterns=WATCH_PATTERNS, ignore_patterns=IGNORE_PATTERNS, ignore_directories=True)
         self.server_process = server_process
         self.worker_process = worker_process
-        self.last_modified = time.time()
-        self.cooldown = 2  # seconds to wait before restarting
+        self.debounce = 2  # seconds without changes before restarting
+        self.restart_timer = None
+        self.lock = threading.Lock()
 
     def on_modified(self, event):
-        if event.is_directory:
-            return
-        
-        if not event.src_path.endswith('.py'):
-            return
+        self.schedule_restart(event)
 
-        current_time = time.time()
-        if current_time - self.last_modified < self.cooldown:
-            return
+    def on_created(self, event):
+        self.schedule_restart(event)
 
-        self.last_modified = current_time
+    def on_moved(self, event):
+        # Editors that save through a temporary file and rename it show up as moves
+        self.schedule_restart(event)
+
+    def schedule_restart(self, event):
         logging.info(f"Change detected in {event.src_path}")
-        
-        # Restart the services
-        self.restart_services()
+        # Each change pushes the restart back, so a burst of saves restarts once
+        with self.lock:
+            if self.restart_timer is not None:
+                self.restart_timer.cancel()
+            self.restart_timer = threading.Timer(self.debounce, self.restart_services)
+            self.restart_timer.daemon = True
+            self.restart_timer.start()
 
     def restart_services(self):
         logging.info("Restarting services...")
@@ -115,6 +125,8 @@ def main():
                 )
 
     except KeyboardInterrupt:
+        if event_handler.restart_timer is not None:
+            event_handler.restart_timer.cancel()
         observer.stop()
         server_process.terminate()
         worker_process.terminate()
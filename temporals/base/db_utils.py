@@ -5,8 +5,13 @@ Replace the stubbed logic with your actual DB/ORM/API code.
 """
 import logging
 from typing import Optional
-import random
 import os
+import numpy as np
+
+# Stub report numbers are drawn in blocks from one Generator rather than one random call each
+REPORT_NUMBER_BLOCK = 4096
+_rng = np.random.default_rng()
+_report_numbers: list[int] = []
 
 # Example: Replace with your ORM or DB client
 # from your_orm import Session, TrustScore, UserMetadata
@@ -47,7 +52,15 @@ def get_or_create_report_number(latitude: float, longitude: float) -> str:
     # if report: return report.number
     # else: ... generate, store, and return new number
     logging.info(f"Stub: Generate report number for ({latitude}, {longitude})")
-    return f"AIS-{random.randint(10000, 99999)}"
+    return f"AIS-{_next_report_number()}"
+
+def _next_report_number() -> int:
+    """
+    Next random five-digit report number, refilling the block when it runs out.
+    """
+    if not _report_numbers:
+        _report_numbers.extend(_rng.integers(10000, 100000, REPORT_NUMBER_BLOCK).tolist())
+    return _report_numbers.pop()
 
 def get_visibility_for_location(latitude: float, longitude: float) -> int:
     """
@@ -38,6 +38,14 @@ class ReportDetailsRequest(BaseModel):
     location: str
     picture_url: str
 
+# Type and help information served ahead of the stored metrics
+_METRICS_HEADER = (
+    '# HELP ship_trust_score Trust score for ships\n'
+    '# TYPE ship_trust_score gauge\n'
+    '# HELP ship_ais_number_total Total number of ships with AIS numbers\n'
+    '# TYPE ship_ais_number_total counter\n'
+)
+
 # connect Temporal client at startup
 temporal_client = None
 initial_metrics = []
@@ -104,14 +112,7 @@ async def submit_ship(ship: ReportDetails):
 @app.get("/metrics")
 async def get_metrics():
     # Combine all metrics
-    result = (
-        '# HELP ship_trust_score Trust score for ships\n'
-        '# TYPE ship_trust_score gauge\n'
-        '# HELP ship_ais_number_total Total number of ships with AIS numbers\n'
-        '# TYPE ship_ais_number_total counter\n'
-    )
-    result += '\n'.join(initial_metrics + final_metrics)
-    return result
+    return _METRICS_HEADER + '\n'.join(initial_metrics + final_metrics)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
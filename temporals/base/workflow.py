@@ -22,6 +22,14 @@ RETRY_POLICY = RetryPolicy(
     maximum_attempts=5,
 )
 
+# Type and help information prepended to every metrics query
+_METRICS_HEADER = (
+    '# HELP ship_trust_score Trust score for ships\n'
+    '# TYPE ship_trust_score gauge\n'
+    '# HELP ship_report_number_total Total number of ships with AIS numbers\n'
+    '# TYPE ship_report_number_total counter\n'
+)
+
 @workflow.defn
 class ReportDetailsWorkflow:
     def __init__(self):
@@ -30,15 +38,26 @@ class ReportDetailsWorkflow:
     @workflow.run
     async def run(self, ship: ReportDetails) -> EnrichedReportDetails:
         logging.info(f"Running workflow with ship details: {ship}")
-        
-        # Store initial metrics
-        initial_metric = await workflow.execute_activity(
-            convert_to_prometheus_metrics,
-            ship,
-            start_to_close_timeout=timedelta(seconds=5),
-        )
-        self._metrics.append(initial_metric)
-        logging.info(f"Stored initial metric: {initial_metric}")
+
+        # Workflows started before the initial metric moved off the critical path replay the old sequence
+        concurrent_initial_metric = workflow.patched("concurrent-initial-metric")
+        if concurrent_initial_metric:
+            # Render the initial metric alongside the enrichment activities; it is stored as soon as it completes
+            initial_metric = workflow.start_activity(
+                convert_to_prometheus_metrics,
+                ship,
+                start_to_close_timeout=timedelta(seconds=5),
+            )
+            initial_metric.add_done_callback(self._store_initial_metric)
+        else:
+            # Store initial metrics
+            initial_metric = await workflow.execute_activity(
+                convert_to_prometheus_metrics,
+                ship,
+                start_to_close_timeout=timedelta(seconds=5),
+            )
+            self._metrics.append(initial_metric)
+            logging.info(f"Stored initial metric: {initial_metric}")
 
         enriched = EnrichedReportDetails(**ship.__dict__)
 
@@ -89,6 +108,10 @@ class ReportDetailsWorkflow:
             enriched.enriched_description = "Description enrichment failed. Please check the logs for details."
             logging.info("Set default description due to enrichment failure")
 
+        if concurrent_initial_metric:
+            # Surface a failed initial metric activity, as the sequential path does
+            await initial_metric
+
         # Store final metrics
         final_metric = await workflow.execute_activity(
             convert_to_prometheus_metrics,
@@ -100,17 +123,14 @@ class ReportDetailsWorkflow:
 
         return enriched
 
+    def _store_initial_metric(self, handle) -> None:
+        if not handle.cancelled() and handle.exception() is None:
+            # The final metric is only requested after this activity completes, so this is always first
+            self._metrics.append(handle.result())
+            logging.info(f"Stored initial metric: {handle.result()}")
+
     @workflow.query
     def get_metrics(self) -> str:
         if not self._metrics:
             return ""
-        # Add type and help information
-        result = (
-            '# HELP ship_trust_score Trust score for ships\n'
-            '# TYPE ship_trust_score gauge\n'
-            '# HELP ship_report_number_total Total number of ships with AIS numbers\n'
-            '# TYPE ship_report_number_total counter\n'
-        )
-        # Add all metrics
-        result += '\n'.join(self._metrics)
-        return result
\ No newline at end of file
+        return _METRICS_HEADER + '\n'.join(self._metrics)
\ No newline at end of file